@@ -0,0 +1,197 @@
+import os
+import struct
+import tarfile
+import time
+import zipfile
+from io import BytesIO
+
+from compressed import build_seek_points, detect_compression, open_archive, rewrite_archive, write_seek_index
+
+ZIP_MAGIC = (b'PK\x03\x04', b'PK\x05\x06')
+# Локальный заголовок члена zip: сигнатура и поля до длин имени и extra
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+
+class TarArchive:
+    """
+    Tar-архив, в том числе сжатый. Интерфейс, общий для всех форматов образа:
+    getmembers(), extractfile(), append(), close() и признаки
+    sidecar_index — оглавление сохраняется в файле-спутнике .vfsidx, а
+    write_seek_index() дополняет его данными бэкенда,
+    mappable — данные членов лежат в файле по offset_data и их можно отображать в память,
+    seeks_backward_cheaply — член можно дёшево читать блоками с конца.
+    """
+
+    sidecar_index = True
+
+    def __init__(self, path):
+        self.path = path
+        self.compression = detect_compression(path)
+        self.tar = open_archive(path)
+        self.mappable = self.compression is None
+        # bz2 и xz при переходе назад распаковываются заново с начала;
+        # gzip читается через CheckpointedGzipReader
+        self.seeks_backward_cheaply = self.compression not in ('bz2', 'xz')
+
+    def getmembers(self):
+        return self.tar.getmembers()
+
+    def extractfile(self, info):
+        return self.tar.extractfile(info)
+
+    def append(self, entries):
+        if self.compression is not None:
+            # Сжатый tar нельзя дописать, он переписывается целиком
+            rewrite_archive(self.path, self.compression, entries)
+            return
+        with tarfile.open(self.path, mode='a') as tar:
+            for info, data in entries:
+                tar.addfile(tarinfo=info, fileobj=BytesIO(data))
+
+    def write_seek_index(self):
+        """
+        Вызывается при индексировании. Для gzip строит точки доступа в сжатом
+        потоке и сохраняет их рядом с архивом, чтобы следующие процессы читали
+        члены из середины архива без распаковки с начала.
+        """
+        reader = self.tar.fileobj if self.compression == 'gz' else None
+        if reader is None or reader.has_seek_index:
+            return
+        seek_index = build_seek_points(self.path)
+        reader.use_seek_index(*seek_index)
+        try:
+            write_seek_index(self.path, *seek_index)
+        except OSError:
+            # Каталог архива может быть недоступен для записи — точки остаются в памяти
+            pass
+
+    def close(self):
+        self.tar.close()
+
+
+class ZipArchive:
+    """
+    Zip-архив с тем же интерфейсом, что и TarFile: getmembers() возвращает
+    TarInfo, extractfile() — поток члена архива. Центральный каталог zip уже
+    является индексом, поэтому файл-спутник для него не нужен. Члены, сохранённые
+    без сжатия, получают offset_data и читаются через отображение архива в память;
+    у сжатых offset_data равен -1.
+    """
+
+    sidecar_index = False
+    # Несжатые члены читаются через отображение архива в память
+    mappable = True
+    # Переход назад в сжатом члене zip распаковывает его заново с начала
+    seeks_backward_cheaply = False
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+
+    def getmembers(self):
+        members = []
+        with open(self.path, 'rb') as f:
+            for zinfo in self.zip.infolist():
+                info = tarfile.TarInfo(zinfo.filename)
+                info.offset_data = -1
+                if zinfo.is_dir():
+                    info.type = tarfile.DIRTYPE
+                else:
+                    info.size = zinfo.file_size
+                    if zinfo.compress_type == zipfile.ZIP_STORED and not zinfo.flag_bits & 0x1:
+                        info.offset_data = self._data_offset(f, zinfo)
+                info.mtime = time.mktime(zinfo.date_time + (0, 0, -1))
+                members.append(info)
+        return members
+
+    @staticmethod
+    def _data_offset(f, zinfo):
+        # Данные начинаются после локального заголовка, длина extra в нём может
+        # отличаться от записанной в центральном каталоге
+        f.seek(zinfo.header_offset)
+        header = f.read(ZIP_LOCAL_HEADER.size)
+        if len(header) < ZIP_LOCAL_HEADER.size:
+            return -1
+        signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(header)
+        if signature != b'PK\x03\x04':
+            return -1
+        return zinfo.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+
+    def extractfile(self, info):
+        return self.zip.open(info.name)
+
+    def append(self, entries):
+        with zipfile.ZipFile(self.path, 'a') as zf:
+            for info, data in entries:
+                zinfo = zipfile.ZipInfo(info.name, date_time=time.localtime(info.mtime)[:6])
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zf.writestr(zinfo, data)
+
+    def close(self):
+        self.zip.close()
+
+
+class DirectoryArchive:
+    """
+    Каталог хост-системы в роли образа файловой системы. Члены — записи дерева
+    каталогов (символические ссылки не разыменовываются, чтобы не выйти за
+    пределы корня); данные читаются прямо из файлов хоста.
+    """
+
+    sidecar_index = False
+    mappable = False
+    seeks_backward_cheaply = True
+
+    def __init__(self, path):
+        self.path = path
+
+    def getmembers(self):
+        members = []
+        stack = ['']
+        while stack:
+            relative = stack.pop()
+            with os.scandir(os.path.join(self.path, relative)) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    name = relative + entry.name
+                    st = entry.stat(follow_symlinks=False)
+                    info = tarfile.TarInfo(name)
+                    info.mtime = st.st_mtime
+                    if entry.is_symlink():
+                        info.type = tarfile.SYMTYPE
+                        info.linkname = os.readlink(entry.path)
+                    elif entry.is_dir(follow_symlinks=False):
+                        info.type = tarfile.DIRTYPE
+                        stack.append(name + '/')
+                    else:
+                        info.size = st.st_size
+                    members.append(info)
+        return members
+
+    def extractfile(self, info):
+        return open(os.path.join(self.path, info.name), 'rb')
+
+    def append(self, entries):
+        for info, data in entries:
+            path = os.path.join(self.path, info.name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            os.utime(path, (info.mtime, info.mtime))
+
+    def close(self):
+        pass
+
+
+def open_backend(path):
+    """
+    Открывает образ файловой системы. Формат определяется по пути из конфигурации:
+    каталог хоста, zip-архив (по сигнатуре) или tar, в том числе сжатый.
+    Интерфейс у всех вариантов общий, см. TarArchive.
+    """
+    if os.path.isdir(path):
+        return DirectoryArchive(path)
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    if head in ZIP_MAGIC:
+        return ZipArchive(path)
+    return TarArchive(path)
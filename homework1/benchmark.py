@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from io import BytesIO
+
+from session import ShellSession
+from vfs import index_path
+
+# Сценарии: форма дерева каталогов синтетического архива
+SHAPES = ('wide', 'deep', 'large_file')
+DEFAULT_MEMBERS = (10000, 100000)
+REPEAT = 20
+
+
+class CountingSink:
+    # Вывод команд только подсчитывается: пиковый RSS не должен включать вывод tac
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text):
+        self.lines += 1
+
+
+def member_paths(shape, members):
+    """
+    Пути файлов синтетического архива:
+    wide — все файлы в нескольких широких каталогах,
+    deep — цепочка вложенных каталогов глубиной до 64 уровней.
+    """
+    if shape == 'deep':
+        depth = 64
+        for i in range(members):
+            level = i % depth
+            yield '/'.join(f"d{j}" for j in range(level + 1)) + f"/file{i}.txt"
+    else:
+        for i in range(members):
+            yield f"dir{i % 10}/file{i}.txt"
+
+
+def generate_archive(path, shape, members, large_file_size):
+    with tarfile.open(path, 'w') as tar:
+        for name in member_paths(shape, members):
+            data = f"{name}\n".encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, BytesIO(data))
+        line = b"x" * 79 + b"\n"
+        size = large_file_size if shape == 'large_file' else len(line) * 1000
+        info = tarfile.TarInfo("logs/big.log")
+        info.size = size - size % len(line)
+        tar.addfile(info, _RepeatingReader(line, info.size))
+
+
+class _RepeatingReader:
+    # Источник данных большого файла без его сборки в памяти
+    def __init__(self, line, size):
+        self.line = line
+        self.total = size
+        self.remaining = size
+
+    def read(self, size):
+        # tarfile ожидает ровно size байт, поэтому строки режутся по границе блока
+        size = min(size, self.remaining)
+        offset = (self.total - self.remaining) % len(self.line)
+        data = (self.line * (size // len(self.line) + 2))[offset:offset + size]
+        self.remaining -= len(data)
+        return data
+
+
+def timed(fn, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {
+        'median_ms': statistics.median(samples) * 1000,
+        'max_ms': max(samples) * 1000,
+    }
+
+
+def run_case(archive_path, shape):
+    """
+    Замеры для одного архива в текущем процессе. Пиковый RSS имеет смысл
+    только если процесс запускался ради этого сценария (см. run_isolated).
+    """
+    if os.path.exists(index_path(archive_path)):
+        os.remove(index_path(archive_path))
+    results = {}
+    sink = CountingSink()
+
+    started = time.perf_counter()
+    ShellSession(archive_path, sink=sink).close_filesystem()
+    results['startup_cold_ms'] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    session = ShellSession(archive_path, sink=sink)
+    results['startup_warm_ms'] = (time.perf_counter() - started) * 1000
+
+    target = '/' + '/'.join(f"d{j}" for j in range(64)) if shape == 'deep' else '/dir0'
+    results['cd'] = timed(lambda: session.execute(f"cd {target}"), REPEAT)
+    results['ls'] = timed(lambda: session.execute("ls"), REPEAT)
+    session.execute("cd /logs")
+    results['tac'] = timed(lambda: session.execute("tac big.log"), 3)
+    counter = iter(range(REPEAT))
+    results['touch'] = timed(lambda: session.execute(f"touch new{next(counter)}.txt"), REPEAT)
+
+    session.vfs.pending.clear()
+    session.close_filesystem()
+    results['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def run_isolated(archive_path, shape):
+    # Отдельный процесс на сценарий, чтобы пиковый RSS не смешивался
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-case', archive_path, shape],
+        check=True, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output)
+
+
+def compare(current, previous, threshold):
+    # Метрики, которые выросли больше чем в threshold раз
+    regressions = []
+    old_cases = {(case['shape'], case['members']): case for case in previous['cases']}
+    for case in current['cases']:
+        old = old_cases.get((case['shape'], case['members']))
+        if old is None:
+            continue
+        for metric, value in case['results'].items():
+            new_value = value['median_ms'] if isinstance(value, dict) else value
+            old_value = old['results'].get(metric)
+            old_value = old_value['median_ms'] if isinstance(old_value, dict) else old_value
+            if old_value and new_value > old_value * threshold:
+                regressions.append(
+                    f"{case['shape']}/{case['members']} {metric}: {old_value:.3f} -> {new_value:.3f}"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shell emulator benchmarks on synthetic archives")
+    parser.add_argument('--members', type=int, nargs='+', default=list(DEFAULT_MEMBERS))
+    parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument('--large-file-mb', type=int, default=64)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="previous results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--run-case', nargs=2, metavar=('ARCHIVE', 'SHAPE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case)))
+        return 0
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'cases': [],
+    }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for shape in args.shapes:
+            for members in args.members:
+                archive_path = os.path.join(temp_dir, f"{shape}-{members}.tar")
+                generate_archive(archive_path, shape, members, args.large_file_mb * 1024 * 1024)
+                results = run_isolated(archive_path, shape)
+                report['cases'].append({
+                    'shape': shape,
+                    'members': members,
+                    'archive_bytes': os.path.getsize(archive_path),
+                    'results': results,
+                })
+                print(f"{shape:>10} {members:>8}: startup {results['startup_cold_ms']:.1f} ms cold, "
+                      f"{results['startup_warm_ms']:.1f} ms warm; ls {results['ls']['median_ms']:.3f} ms; "
+                      f"tac {results['tac']['median_ms']:.1f} ms; rss {results['peak_rss_kb']} KB")
+                os.remove(archive_path)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"Regression: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,499 @@
+import os
+import posixpath
+import re
+import threading
+import time
+
+from vfs import get_vfs, resolve_path
+
+DEFAULT_HEAD_LINES = 10
+REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+
+class Operator(str):
+    # Оператор командной строки ('|'); слово в кавычках с тем же текстом — обычный str
+    pass
+
+
+def tokenize(command):
+    """
+    Разбивает строку на слова по правилам POSIX-оболочки: кавычки ' и "
+    и экранирование '\\'. Неэкранированный '|' вне кавычек — отдельный токен
+    Operator, '#' — обычный символ.
+    """
+    tokens = []
+    word = []
+    in_word = False
+    quote = None
+    pos = 0
+    while pos < len(command):
+        char = command[pos]
+        if quote == "'":
+            if char == "'":
+                quote = None
+            else:
+                word.append(char)
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char == '\\' and command[pos + 1:pos + 2] in ('"', '\\'):
+                pos += 1
+                word.append(command[pos])
+            else:
+                word.append(char)
+        elif char == '\\':
+            if pos + 1 == len(command):
+                raise ValueError("no escaped character")
+            pos += 1
+            word.append(command[pos])
+            in_word = True
+        elif char in '"\'':
+            quote = char
+            in_word = True
+        elif char.isspace() or char == '|':
+            if in_word:
+                tokens.append(''.join(word))
+                word = []
+                in_word = False
+            if char == '|':
+                if command[pos + 1:pos + 2] == '|':
+                    raise ValueError("unexpected '||'")
+                tokens.append(Operator(char))
+        else:
+            word.append(char)
+            in_word = True
+        pos += 1
+    if quote is not None:
+        raise ValueError("no closing quotation")
+    if in_word:
+        tokens.append(''.join(word))
+    return tokens
+
+
+def format_size(size, human=False):
+    # Размер в байтах или, с human, в единицах K/M/G/T, как du -h
+    if not human:
+        return str(size)
+    for unit in ('', 'K', 'M', 'G'):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit else str(size)
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def split_pipeline(tokens):
+    stages = [[]]
+    for token in tokens:
+        if isinstance(token, Operator):
+            stages.append([])
+        else:
+            stages[-1].append(token)
+    return stages
+
+
+class CommandProcessor:
+    def __init__(self):
+        self.start_time = time.time()
+        self.cancel_event = threading.Event()
+        # Команды верхнего уровня: обработчик(shell, args)
+        self.commands = {}
+        # Команды, которые могут участвовать в конвейере: генератор(shell, args, stdin),
+        # выдающий строки вывода; stdin — итератор строк предыдущей команды или None
+        self.streams = {}
+        self.register("ls", self.ls, self.iter_ls)
+        self.register("cd", self.cd)
+        self.register("whoami", self.whoami, self.iter_whoami)
+        self.register("tac", self.tac, self.iter_tac)
+        self.register("head", self.head, self.iter_head)
+        self.register("find", stream=self.iter_find)
+        self.register("grep", stream=self.iter_grep)
+        self.register("du", stream=self.iter_du)
+        self.register("tree", stream=self.iter_tree)
+        self.register("touch", self.touch)
+        self.register("sync", self.sync)
+        self.register("exit", self.close_application)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def reset_cancel(self):
+        self.cancel_event.clear()
+
+    def register(self, name, handler=None, stream=None):
+        if handler is None:
+            # Команда без отдельного обработчика просто выводит строки своего генератора
+            def handler(shell, args):
+                self.emit(shell, stream(shell, args, None))
+        self.commands[name] = handler
+        if stream is not None:
+            self.streams[name] = stream
+
+    def execute(self, command, shell):
+        try:
+            tokens = tokenize(command)
+        except ValueError as e:
+            shell.display_output(f"Syntax error: {e}")
+            return
+        if not tokens:
+            return
+
+        stages = split_pipeline(tokens)
+        if len(stages) == 1:
+            cmd_name, args = stages[0][0], stages[0][1:]
+            handler = self.commands.get(cmd_name)
+            if handler is None:
+                shell.display_output(f"Command '{cmd_name}' is not supported.")
+                return
+            handler(shell, args)
+            return
+        self.run_pipeline(shell, stages)
+
+    def run_pipeline(self, shell, stages):
+        if any(not stage for stage in stages):
+            shell.display_output("Syntax error near '|'.")
+            return
+        for cmd_name, *_ in stages:
+            if cmd_name not in self.streams:
+                if cmd_name in self.commands:
+                    shell.display_output(f"Command '{cmd_name}' cannot be used in a pipeline.")
+                else:
+                    shell.display_output(f"Command '{cmd_name}' is not supported.")
+                return
+
+        # Генераторы связываются в цепочку: каждая команда лениво читает вывод предыдущей,
+        # поэтому, когда последняя команда останавливается (например, head), чтение
+        # в начале конвейера тоже прекращается
+        generators = []
+        stdin = None
+        for cmd_name, *args in stages:
+            stdin = self.streams[cmd_name](shell, args, stdin)
+            generators.append(stdin)
+        try:
+            self.emit(shell, stdin)
+        finally:
+            for generator in reversed(generators):
+                generator.close()
+
+    def emit(self, shell, lines):
+        for line in lines:
+            if self.cancelled:
+                shell.display_output("^C")
+                break
+            shell.display_output(line)
+
+    def close_application(self, shell, args=None):
+        shell.display_output("Exiting emulator...")
+        shell.close_filesystem()
+        shell.close()
+
+    def ls(self, shell, args=None):
+        contents = list(self.iter_ls(shell, args or [], None))
+
+        if contents:
+            shell.display_output("\n".join(contents))
+        else:
+            shell.display_output("No files or directories in the current directory.")
+
+    def iter_ls(self, shell, args, stdin):
+        yield from get_vfs(shell).listdir(shell.current_directory) or []
+
+    def cd(self, shell, args):
+        if not args:
+            shell.display_output("No directory specified.")
+            return
+
+        path = args[0]
+        if path == ".." and shell.current_directory == "/":
+            shell.display_output("You are already at the root directory.")
+            return
+
+        try:
+            vfs = get_vfs(shell)
+            new_dir = resolve_path(shell.current_directory, path)
+            node = vfs.lookup(new_dir)
+
+            if node is not None and node.isdir():
+                shell.current_directory = new_dir.rstrip('/') + "/"
+                shell.display_output(f"Current directory: {shell.current_directory}")
+            else:
+                shell.display_output(f"Directory '{path}' not found.")
+        except Exception as e:
+            shell.display_output(f"Error accessing archive: {e}")
+
+    def whoami(self, shell, args=None):
+        self.emit(shell, self.iter_whoami(shell, args or [], None))
+
+    def iter_whoami(self, shell, args, stdin):
+        try:
+            yield os.getlogin()
+        except Exception as e:
+            shell.display_output(f"Error executing command 'whoami': {e}")
+
+    def tac(self, shell, args):
+        if not args:
+            shell.display_output("No file specified.")
+            return
+        self.emit(shell, self.iter_tac(shell, args, None))
+
+    def iter_tac(self, shell, args, stdin):
+        if not args:
+            if stdin is None:
+                shell.display_output("No file specified.")
+                return
+            # Вывод предыдущей команды приходится собрать целиком
+            yield from reversed(list(stdin))
+            return
+
+        try:
+            vfs = get_vfs(shell)
+            node = self._find_file(shell, vfs, args[0])
+            if node is not None:
+                for line in vfs.iter_lines_reversed(node):
+                    yield str(line, 'utf-8', errors='ignore')
+        except Exception as e:
+            shell.display_output(f"Error opening archive: {e}")
+
+    def head(self, shell, args):
+        self.emit(shell, self.iter_head(shell, args, None))
+
+    def iter_head(self, shell, args, stdin):
+        count = DEFAULT_HEAD_LINES
+        args = list(args)
+        try:
+            if args and args[0] == "-n":
+                count = int(args[1])
+                args = args[2:]
+            elif args and args[0].startswith("-") and args[0][1:].isdigit():
+                count = int(args[0][1:])
+                args = args[1:]
+        except (IndexError, ValueError):
+            shell.display_output("Usage: head [-n N] [file]")
+            return
+
+        if args:
+            yield from self._head_of_file(shell, args[0], count)
+        elif stdin is not None:
+            # zip с range первым не запрашивает у stdin лишнюю строку
+            for _, line in zip(range(count), stdin):
+                yield line
+        else:
+            shell.display_output("No file specified.")
+
+    def _head_of_file(self, shell, filename, count):
+        try:
+            vfs = get_vfs(shell)
+            node = self._find_file(shell, vfs, filename)
+            if node is not None:
+                lines = vfs.iter_lines(node)
+                try:
+                    for _, line in zip(range(count), lines):
+                        yield str(line, 'utf-8', errors='ignore')
+                finally:
+                    lines.close()
+        except Exception as e:
+            shell.display_output(f"Error opening archive: {e}")
+
+    def _find_file(self, shell, vfs, path):
+        node = vfs.resolve(shell.current_directory, path)
+        if node is None:
+            shell.display_output(f"File '{path}' not found.")
+            return None
+        if node.isdir():
+            shell.display_output(f"'{path}' is a directory.")
+            return None
+        if not node.isfile():
+            return None
+        return node
+
+    def iter_find(self, shell, args, stdin):
+        args = list(args)
+        if "-name" in args:
+            position = args.index("-name")
+            pattern = args[position + 1] if position + 1 < len(args) else None
+            directory = args[0] if position > 0 else "."
+        elif len(args) == 1:
+            directory, pattern = ".", args[0]
+        elif len(args) == 2:
+            directory, pattern = args
+        else:
+            pattern = None
+        if not pattern:
+            shell.display_output("Usage: find [dir] [-name] pattern")
+            return
+
+        vfs = get_vfs(shell)
+        root = vfs.resolve(shell.current_directory, directory)
+        if root is None or not root.isdir():
+            shell.display_output(f"Directory '{directory}' not found.")
+            return
+        prefix = root.path.rstrip('/') + '/'
+        for node in vfs.find(pattern):
+            path = node.path
+            if path.startswith(prefix):
+                yield path
+
+    def iter_grep(self, shell, args, stdin):
+        args = list(args)
+        recursive = "-r" in args
+        args = [arg for arg in args if arg != "-r"]
+        if not args:
+            shell.display_output("Usage: grep [-r] pattern [path...]")
+            return
+        pattern, paths = args[0], args[1:]
+        try:
+            regex = re.compile(pattern)
+        except re.error as e:
+            shell.display_output(f"Invalid pattern '{pattern}': {e}")
+            return
+
+        if not paths:
+            if stdin is not None and not recursive:
+                for line in stdin:
+                    if regex.search(line):
+                        yield line
+                return
+            if not recursive:
+                shell.display_output("No file specified.")
+                return
+            paths = ["."]
+
+        vfs = get_vfs(shell)
+        files = []
+        for path in paths:
+            node = vfs.resolve(shell.current_directory, path)
+            if node is None:
+                shell.display_output(f"File '{path}' not found.")
+            elif node.isdir():
+                if recursive:
+                    files.extend(self._grep_candidates(shell, vfs, node.path, pattern))
+                else:
+                    shell.display_output(f"'{path}' is a directory.")
+            elif node.isfile():
+                files.append(node)
+
+        show_names = recursive or len(files) > 1
+        for node in files:
+            if self.cancelled:
+                return
+            try:
+                for raw_line in vfs.iter_lines(node):
+                    line = str(raw_line, 'utf-8', errors='ignore')
+                    if regex.search(line):
+                        yield f"{node.path}:{line}" if show_names else line
+            except Exception as e:
+                shell.display_output(f"Error opening archive: {e}")
+
+    def _grep_candidates(self, shell, vfs, path, pattern):
+        # Если индекс включён, файлы для шаблона без спецсимволов отбираются по триграммам
+        files = vfs.iter_files(path)
+        if (not shell.content_index or any(char in REGEX_CHARS for char in pattern)
+                or len(pattern.encode('utf-8')) < 3):
+            return list(files)
+        index = vfs.content_index(path)
+        candidates = index.candidates(pattern.encode('utf-8'))
+        return [node for node in files if node in candidates or not index.covers(node)]
+
+    def iter_du(self, shell, args, stdin):
+        # Размеры берутся из агрегатов индекса, поэтому не зависят от числа файлов
+        human = "-h" in args
+        summary = "-s" in args
+        paths = [arg for arg in args if arg not in ("-h", "-s")] or ["."]
+        vfs = get_vfs(shell)
+        for path in paths:
+            full_path = resolve_path(shell.current_directory, path)
+            node = vfs.lookup(full_path)
+            if node is None:
+                shell.display_output(f"File '{path}' not found.")
+                continue
+            if node.isdir() and not summary:
+                for name in vfs.complete(full_path, ''):
+                    child_path = posixpath.join(full_path, name)
+                    if vfs.lookup(child_path).isdir():
+                        size, _ = vfs.usage(child_path)
+                        yield f"{format_size(size, human)}\t{posixpath.join(path, name)}"
+            size, _ = vfs.usage(full_path)
+            yield f"{format_size(size, human)}\t{path}"
+
+    def iter_tree(self, shell, args, stdin):
+        args = list(args)
+        depth = None
+        try:
+            if "-L" in args:
+                position = args.index("-L")
+                depth = int(args[position + 1])
+                del args[position:position + 2]
+        except (IndexError, ValueError):
+            shell.display_output("Usage: tree [-L depth] [dir]")
+            return
+        path = args[0] if args else "."
+
+        vfs = get_vfs(shell)
+        root = resolve_path(shell.current_directory, path)
+        node = vfs.lookup(root)
+        if node is None or not node.isdir():
+            shell.display_output(f"Directory '{path}' not found.")
+            return
+        size, _ = vfs.usage(root)
+        yield f"[{format_size(size, True):>6}]  {path}"
+
+        dirs = files = 0
+        # Обход в глубину без рекурсии: каталог, его отсортированные дети,
+        # номер следующего ребёнка и отступ для строк этого уровня
+        stack = [(root, vfs.complete(root, ''), 0, '')]
+        while stack:
+            dir_path, names, index, indent = stack.pop()
+            if index >= len(names):
+                continue
+            stack.append((dir_path, names, index + 1, indent))
+            last = index == len(names) - 1
+            child_path = posixpath.join(dir_path, names[index])
+            child = vfs.lookup(child_path)
+            size, _ = vfs.usage(child_path)
+            yield f"{indent}{'└── ' if last else '├── '}[{format_size(size, True):>6}]  {names[index]}"
+            if child.isdir():
+                dirs += 1
+                if depth is None or len(stack) < depth:
+                    stack.append((child_path, vfs.complete(child_path, ''), 0,
+                                  indent + ('    ' if last else '│   ')))
+            else:
+                files += 1
+        yield ""
+        yield f"{dirs} directories, {files} files"
+
+    def touch(self, shell, args):
+        if not args:
+            shell.display_output("No file name specified.")
+            return
+
+        filename = args[0]
+        full_path = resolve_path(shell.current_directory, filename)
+
+        try:
+            vfs = get_vfs(shell)
+            if vfs.lookup(full_path) is not None:
+                shell.display_output(f"File '{filename}' already exists.")
+                return
+            parent = vfs.lookup(posixpath.dirname(full_path))
+            if parent is None or not parent.isdir():
+                shell.display_output(f"Directory '{posixpath.dirname(filename)}' not found.")
+                return
+            vfs.write_file(full_path)
+            shell.display_output(f"File '{filename}' created successfully.")
+        except Exception as e:
+            shell.display_output(f"Error creating or updating file: {e}")
+
+    def sync(self, shell, args=None):
+        vfs = get_vfs(shell)
+        if not vfs.dirty:
+            shell.display_output("Nothing to sync.")
+            return
+
+        try:
+            count = shell.sync_filesystem()
+            shell.display_output(f"Synced {count} file(s) to archive.")
+        except Exception as e:
+            shell.display_output(f"Error writing archive: {e}")
@@ -0,0 +1,109 @@
+import os
+import posixpath
+
+from vfs import prefix_range
+
+# Сколько вариантов дополнения показывать, если подходящих слишком много
+COMPLETION_LIST_LIMIT = 100
+HISTORY_LIMIT = 10000
+
+
+def common_prefix(names):
+    return os.path.commonprefix(names) if names else ''
+
+
+class Completer:
+    """
+    Дополнение по Tab: первое слово команды дополняется по именам команд,
+    остальные — по путям виртуальной файловой системы относительно текущего каталога.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def complete(self, text):
+        """
+        Возвращает (новый текст, варианты). Если вариант один, слово дополняется
+        целиком; если несколько — до их общего начала, а сами варианты
+        возвращаются для показа пользователю.
+        """
+        head, word = split_word(text)
+        if is_command_position(head):
+            candidates = prefix_range(sorted(self.session.processor.commands), word)
+            if len(candidates) == 1:
+                return head + candidates[0] + ' ', []
+            return head + common_prefix(candidates), candidates
+
+        directory, prefix = posixpath.split(word)
+        vfs = self.session.vfs
+        base = vfs.resolve(self.session.current_directory, directory or '.')
+        if base is None or not base.isdir():
+            return text, []
+        candidates = vfs.complete(base.path, prefix)
+        if len(candidates) == 1:
+            node = vfs.resolve(base.path, candidates[0])
+            suffix = '/' if node is not None and node.isdir() else ' '
+            return head + posixpath.join(directory, candidates[0]) + suffix, []
+        return head + posixpath.join(directory, common_prefix(candidates)), candidates
+
+
+def split_word(text):
+    # Текст до дополняемого слова и само слово (после последнего пробела или '|')
+    cut = max(text.rfind(' '), text.rfind('|')) + 1
+    return text[:cut], text[cut:]
+
+
+def is_command_position(head):
+    stage = head.rsplit('|', 1)[-1]
+    return not stage.strip()
+
+
+class History:
+    """
+    История команд. Хранится в памяти и, если задан path, дописывается в файл
+    построчно, чтобы переживать перезапуск эмулятора.
+    """
+
+    def __init__(self, path=None, limit=HISTORY_LIMIT):
+        self.path = path
+        self.limit = limit
+        self.entries = []
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = [line.rstrip('\n') for line in f if line.strip()]
+            self.entries = lines[-limit:]
+            if len(lines) > 2 * limit:
+                # Файл только дописывается, поэтому изредка его нужно сокращать
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(entry + '\n' for entry in self.entries)
+
+    def add(self, command):
+        command = command.strip()
+        if not command or (self.entries and self.entries[-1] == command):
+            return
+        self.entries.append(command)
+        if len(self.entries) > self.limit:
+            del self.entries[:len(self.entries) - self.limit]
+        if self.path:
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(command + '\n')
+            except OSError:
+                pass
+
+    def search(self, query, before=None):
+        """
+        Обратный поиск: индекс последней записи раньше before, содержащей query,
+        или None. Повторный вызов с найденным индексом даёт следующее совпадение.
+        """
+        start = len(self.entries) if before is None else before
+        for index in range(start - 1, -1, -1):
+            if query in self.entries[index]:
+                return index
+        return None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
@@ -0,0 +1,453 @@
+import io
+import mmap
+import os
+import shutil
+import struct
+import tarfile
+import threading
+import zlib
+from bisect import bisect_right
+from collections import namedtuple
+
+GZIP_MAGIC = b'\x1f\x8b'
+COMPRESSION_MAGIC = {
+    'gz': GZIP_MAGIC,
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+    'zst': b'\x28\xb5\x2f\xfd',
+}
+# Флаги заголовка gzip (RFC 1952)
+GZIP_FHCRC = 0x02
+GZIP_FEXTRA = 0x04
+GZIP_FNAME = 0x08
+GZIP_FCOMMENT = 0x10
+# CRC32 и длина в конце каждого gzip-члена
+GZIP_TRAILER_SIZE = 8
+# Расстояние между контрольными точками в распакованном потоке
+CHECKPOINT_SPACING = 1024 * 1024
+INPUT_CHUNK = 64 * 1024
+OUTPUT_CHUNK = 64 * 1024
+# Окно deflate: обратные ссылки достают не дальше 32 КиБ назад
+WINDOW_SIZE = 32 * 1024
+RAW_DEFLATE = -zlib.MAX_WBITS
+
+# Файл-спутник с точками доступа рядом с архивом: заголовок (сигнатура, размер
+# и mtime архива, длина распакованного потока, число точек), затем точки —
+# позиция в распакованном потоке, байт и бит начала deflate-блока во входе,
+# длина сжатого окна и само окно (последние 32 КиБ вывода перед блоком)
+SEEK_INDEX_SUFFIX = '.gzidx'
+SEEK_INDEX_MAGIC = b'VFSGZX01'
+SEEK_INDEX_HEADER = struct.Struct('<8sQqQI')
+SEEK_INDEX_POINT = struct.Struct('<QQBI')
+
+SeekPoint = namedtuple('SeekPoint', 'out_pos in_pos bits window')
+
+
+def _bit_fields(fields):
+    # Склеивает поля (значение, ширина в битах) в порядке deflate: младшими битами вперёд
+    value = width = 0
+    for field, field_width in fields:
+        value |= field << width
+        width += field_width
+    return value, width
+
+
+# Пустой блок с фиксированными кодами: BFINAL=0, BTYPE=01 и код конца блока, 10 бит
+EMPTY_FIXED_BLOCK = _bit_fields([(0, 1), (1, 2), (0, 7)])
+# Пустой блок с динамическими кодами, в котором есть только конец блока, — 95 бит.
+# Нечётная длина нужна, чтобы сдвигать начало потока на нечётное число бит
+EMPTY_DYNAMIC_BLOCK = _bit_fields(
+    [(0, 1), (2, 2), (0, 5), (0, 5), (15, 4)]
+    # Длины кодов длин в порядке 16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15:
+    # символу 18 — 1 бит, символам 0 и 1 — по 2 бита
+    + [(length, 3) for length in (0, 0, 1, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0)]
+    # 256 нулевых длин (символ 18: 138 и 118 повторов), длина 1 у конца блока
+    # и у единственного кода расстояния, затем сам конец блока
+    + [(0, 1), (127, 7), (0, 1), (107, 7), (3, 2), (3, 2), (0, 1)]
+)
+
+
+def prime_deflate(bits, byte):
+    """
+    Начало raw deflate-потока для распаковки с бита bits байта byte.
+    В zlib из Python нет inflatePrime, поэтому младшие bits бит байта
+    заменяются пустыми блоками такой длины, что дальнейшие биты сохраняют
+    положение относительно границ байтов (это важно для блоков без сжатия).
+    """
+    if bits % 2 == 0:
+        blocks = [EMPTY_FIXED_BLOCK] * (bits // 2)
+    else:
+        blocks = [EMPTY_DYNAMIC_BLOCK] + [EMPTY_FIXED_BLOCK] * (((bits - 7) % 8) // 2)
+    value, width = _bit_fields(blocks + [(byte >> bits, 8 - bits)])
+    return value.to_bytes(width // 8, 'little')
+
+
+def _raw_decompressor(window=b''):
+    if window:
+        return zlib.decompressobj(RAW_DEFLATE, zdict=window)
+    return zlib.decompressobj(RAW_DEFLATE)
+
+
+def read_gzip_header(f):
+    """
+    Пропускает заголовок gzip-члена с текущей позиции f. Возвращает False,
+    если дальше только конец файла или нулевое выравнивание.
+    """
+    head = f.read(10)
+    if not head.strip(b'\0'):
+        return False
+    if len(head) < 10 or not head.startswith(GZIP_MAGIC) or head[2] != zlib.DEFLATED:
+        raise OSError("not a gzip file")
+    flags = head[3]
+    if flags & GZIP_FEXTRA:
+        extra_size, = struct.unpack('<H', f.read(2))
+        f.read(extra_size)
+    for flag in (GZIP_FNAME, GZIP_FCOMMENT):
+        if flags & flag:
+            while f.read(1) not in (b'\0', b''):
+                pass
+    if flags & GZIP_FHCRC:
+        f.read(2)
+    return True
+
+
+def _inflate_block(data, pos, bits, window, end=None, mask=0):
+    """
+    Распаковывает один deflate-блок, начинающийся с бита bits байта pos.
+    Бит BFINAL блока выставляется, поэтому распаковщик останавливается на его
+    конце. Возвращает вывод блока и номер байта, где блок кончается. Если end
+    задан, вход обрезается этим байтом, а его биты по маске mask инвертируются;
+    тогда возвращается только вывод или None, если блок не закончился.
+    """
+    decompressor = _raw_decompressor(window)
+    output = [decompressor.decompress(prime_deflate(bits, data[pos] | 1 << bits))]
+    if end is not None:
+        tail = bytearray(data[pos + 1:end + 1])
+        tail[-1] ^= mask
+        output.append(decompressor.decompress(tail))
+        return b''.join(output) if decompressor.eof else None
+    fed = pos + 1
+    while not decompressor.eof:
+        chunk = data[fed:fed + INPUT_CHUNK]
+        if not chunk:
+            raise zlib.error("truncated deflate stream")
+        fed += len(chunk)
+        output.append(decompressor.decompress(chunk))
+    return b''.join(output), fed - len(decompressor.unused_data) - 1
+
+
+def _next_block(data, pos, bits, window):
+    """
+    Вывод deflate-блока и начало следующего блока (байт, бит). zlib сообщает
+    только байт, на котором блок кончился; бит находится двоичным поиском:
+    биты после конца блока распаковщик не читает, поэтому их инверсия не
+    меняет результат, а инверсия любого бита кода конца блока — меняет.
+    """
+    output, end = _inflate_block(data, pos, bits, window)
+    low, high = 1, 8
+    while low < high:
+        middle = (low + high) // 2
+        try:
+            same = _inflate_block(data, pos, bits, window, end, 0xFF << middle & 0xFF) == output
+        except zlib.error:
+            same = False
+        if same:
+            high = middle
+        else:
+            low = middle + 1
+    if low == 8:
+        return output, end + 1, 0
+    return output, end, low
+
+
+def build_seek_points(path, spacing=CHECKPOINT_SPACING):
+    """
+    Точки доступа в gzip-файле в духе zran: границы deflate-блоков примерно
+    через каждые spacing байт распакованного потока вместе с окном из
+    последних 32 КиБ вывода. Распаковку можно начать с любой точки, не читая
+    поток с начала. Возвращает длину распакованного потока и список SeekPoint.
+    """
+    points = []
+    out_pos = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        member = read_gzip_header(data)
+        pos, bits, window = data.tell(), 0, b''
+        while member:
+            if not points or out_pos - points[-1].out_pos >= spacing:
+                points.append(SeekPoint(out_pos, pos, bits, window))
+            final = data[pos] >> bits & 1
+            output, pos, bits = _next_block(data, pos, bits, window)
+            out_pos += len(output)
+            window = (window + output[-WINDOW_SIZE:])[-WINDOW_SIZE:]
+            if final:
+                # Конец gzip-члена: за выравниванием до байта идут CRC32 и длина
+                data.seek(pos + (1 if bits else 0) + GZIP_TRAILER_SIZE)
+                member = read_gzip_header(data)
+                pos, bits, window = data.tell(), 0, b''
+                if member:
+                    points.append(SeekPoint(out_pos, pos, bits, window))
+    return out_pos, points
+
+
+def seek_index_path(archive_path):
+    return archive_path + SEEK_INDEX_SUFFIX
+
+
+def _archive_stamp(archive_path):
+    st = os.stat(archive_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_seek_index(archive_path, size, points):
+    archive_size, mtime_ns = _archive_stamp(archive_path)
+    path = seek_index_path(archive_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(SEEK_INDEX_HEADER.pack(SEEK_INDEX_MAGIC, archive_size, mtime_ns, size, len(points)))
+            for point in points:
+                window = zlib.compress(point.window, 1)
+                f.write(SEEK_INDEX_POINT.pack(point.out_pos, point.in_pos, point.bits, len(window)))
+                f.write(window)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_seek_index(archive_path):
+    # (длина распакованного потока, точки) или None, если спутника нет или он устарел
+    try:
+        with open(seek_index_path(archive_path), 'rb') as f:
+            magic, archive_size, mtime_ns, size, count = SEEK_INDEX_HEADER.unpack(
+                f.read(SEEK_INDEX_HEADER.size))
+            if magic != SEEK_INDEX_MAGIC or (archive_size, mtime_ns) != _archive_stamp(archive_path):
+                return None
+            points = []
+            for _ in range(count):
+                out_pos, in_pos, bits, window_size = SEEK_INDEX_POINT.unpack(f.read(SEEK_INDEX_POINT.size))
+                points.append(SeekPoint(out_pos, in_pos, bits, zlib.decompress(f.read(window_size))))
+            return size, points
+    except (OSError, struct.error, zlib.error):
+        return None
+
+
+class CheckpointedGzipReader(io.RawIOBase):
+    """
+    Распакованное содержимое gzip-файла с произвольным доступом.
+    Если рядом с архивом сохранены точки доступа (build_seek_points), чтение с
+    любой позиции распаковывает поток от ближайшей точки, в том числе в новом
+    процессе. Без них по мере распаковки через каждые CHECKPOINT_SPACING байт
+    в памяти сохраняется копия состояния распаковщика; такие точки живут, пока
+    открыт читатель. Последний распакованный сегмент хранится в памяти для
+    повторных чтений рядом.
+    """
+
+    def __init__(self, path, spacing=CHECKPOINT_SPACING, seek_index=None):
+        super().__init__()
+        self.path = path
+        self.spacing = spacing
+        self._file = open(path, 'rb')
+        self._pos = 0
+        self._size = None
+        self._segment_index = None
+        self._segment = b''
+        try:
+            if not read_gzip_header(self._file):
+                raise OSError("not a gzip file")
+        except BaseException:
+            self._file.close()
+            raise
+        # Контрольные точки: позиция в распакованном потоке, позиция во входном
+        # файле, ещё не поданный распаковщику остаток входа, копия распаковщика.
+        # Точки из файла-спутника хранятся как SeekPoint и восстанавливаются при чтении
+        self._positions = [0]
+        self._checkpoints = [(0, self._file.tell(), b'', _raw_decompressor())]
+        if seek_index is not None:
+            self.use_seek_index(*seek_index)
+
+    @property
+    def has_seek_index(self):
+        return isinstance(self._checkpoints[0], SeekPoint)
+
+    def use_seek_index(self, size, points):
+        self._size = size
+        self._positions = [point.out_pos for point in points]
+        self._checkpoints = list(points)
+        self._segment_index = None
+        self._segment = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._total_size() + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        # В отличие от RawIOBase.read, читает до size байт или до конца потока
+        if size is None or size < 0:
+            return self.readall()
+        parts = []
+        while size > 0:
+            data = super().read(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def readinto(self, buffer):
+        while True:
+            if self._size is not None and self._pos >= self._size:
+                return 0
+            index = bisect_right(self._positions, self._pos) - 1
+            self._load_segment(index)
+            offset = self._pos - self._positions[index]
+            if offset < len(self._segment):
+                data = self._segment[offset:offset + len(buffer)]
+                buffer[:len(data)] = data
+                self._pos += len(data)
+                return len(data)
+            if index == len(self._positions) - 1:
+                # Позиция за концом потока
+                return 0
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            self._segment = b''
+        super().close()
+
+    def _total_size(self):
+        while self._size is None:
+            self._load_segment(len(self._positions) - 1)
+        return self._size
+
+    def _load_segment(self, index):
+        if self._segment_index == index:
+            return
+        checkpoint = self._checkpoints[index]
+        if isinstance(checkpoint, SeekPoint):
+            # Сжатый вход с бита bits байта in_pos, история — окно из спутника
+            self._file.seek(checkpoint.in_pos)
+            out_pos, in_pos = checkpoint.out_pos, checkpoint.in_pos + 1
+            tail = prime_deflate(checkpoint.bits, self._file.read(1)[0])
+            decompressor = _raw_decompressor(checkpoint.window)
+        else:
+            out_pos, in_pos, tail, decompressor = checkpoint
+            decompressor = decompressor.copy()
+        self._file.seek(in_pos)
+        is_last = index == len(self._positions) - 1
+        if not is_last:
+            end = self._positions[index + 1]
+        elif self._size is not None:
+            end = self._size
+        else:
+            end = out_pos + self.spacing
+
+        chunks = []
+        while out_pos < end:
+            data = tail or self._file.read(INPUT_CHUNK)
+            if not tail:
+                in_pos += len(data)
+            if not data:
+                self._size = out_pos
+                break
+            chunk = decompressor.decompress(data, min(OUTPUT_CHUNK, end - out_pos))
+            tail = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # Конец gzip-члена: остаток входа в unused_data начинается с CRC32
+                # и длины, за ними может идти следующий член многочленного файла
+                in_pos += GZIP_TRAILER_SIZE - len(decompressor.unused_data)
+                self._file.seek(in_pos)
+                if not read_gzip_header(self._file):
+                    self._file.seek(0, io.SEEK_END)
+                in_pos = self._file.tell()
+                tail = b''
+                decompressor = _raw_decompressor()
+            chunks.append(chunk)
+            out_pos += len(chunk)
+
+        if is_last and self._size is None:
+            self._positions.append(out_pos)
+            self._checkpoints.append((out_pos, in_pos, tail, decompressor.copy()))
+        self._segment_index = index
+        self._segment = b''.join(chunks)
+
+
+class CompressedTarFile(tarfile.TarFile):
+    # TarFile поверх распаковывающего читателя; закрывает читатель вместе с архивом
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.fileobj.close()
+
+
+def detect_compression(path):
+    # Формат сжатия по сигнатуре в начале файла или None для обычного tar
+    with open(path, 'rb') as f:
+        head = f.read(max(len(magic) for magic in COMPRESSION_MAGIC.values()))
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_archive(path):
+    """
+    Открывает образ файловой системы для чтения. gzip-архивы читаются через
+    CheckpointedGzipReader с точками доступа из файла-спутника, если они есть,
+    остальные форматы — средствами tarfile.
+    """
+    compression = detect_compression(path)
+    if compression == 'zst':
+        raise tarfile.ReadError(f"zstd-compressed images are not supported: {path}")
+    if compression == 'gz':
+        reader = CheckpointedGzipReader(path, seek_index=read_seek_index(path))
+        try:
+            return CompressedTarFile(fileobj=reader, mode='r')
+        except Exception:
+            reader.close()
+            raise
+    return tarfile.open(path, 'r')
+
+
+def rewrite_archive(path, compression, entries):
+    """
+    Добавляет записи (TarInfo, данные) в сжатый tar. Режим 'a' у tarfile для
+    сжатых архивов не работает, поэтому архив переписывается потоком во
+    временный файл рядом с исходным и заменяет его атомарно.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with tarfile.open(path, f'r|{compression}') as source, \
+                tarfile.open(tmp_path, f'w:{compression}') as target:
+            for info in source:
+                target.addfile(info, source.extractfile(info) if info.isfile() else None)
+            for info, data in entries:
+                target.addfile(info, io.BytesIO(data))
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,34 @@
+import threading
+from collections import deque
+
+# Не больше 30 перерисовок окна вывода в секунду
+FLUSH_INTERVAL_MS = 1000 // 30
+# Сколько строк хранится в окне вывода; более старые вытесняются
+SCROLLBACK_LINES = 10000
+
+
+class OutputBuffer:
+    """
+    Накопитель вывода команд. Строки копятся между перерисовками окна и
+    забираются одним вызовом drain(), а не добавляются в виджет по одной.
+    Объём ограничен: при переполнении теряются самые старые строки, которые
+    всё равно были бы вытеснены из окна вывода.
+    """
+
+    def __init__(self, max_lines=SCROLLBACK_LINES):
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        lines = text.split('\n')
+        with self._lock:
+            self._lines.extend(lines)
+
+    def drain(self):
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+    def __len__(self):
+        return len(self._lines)
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import sys
+import threading
+
+from backends import open_backend
+from session import ShellSession, read_config
+from vfs import VirtualFileSystem, archive_stamp
+
+PROMPT = "$ "
+
+
+class ConnectionSink:
+    # Передаёт вывод команды, выполняемой в рабочем потоке, в соединение через цикл событий
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+
+    def write(self, text):
+        self.loop.call_soon_threadsafe(self.writer.write, (text + '\n').encode('utf-8'))
+
+
+class SessionManager:
+    """
+    Обслуживает множество сеансов над одним архивом. Индекс архива строится
+    один раз и разделяется всеми сеансами (они его не изменяют); у каждого сеанса
+    свой текущий каталог, слой изменений и дескриптор архива для чтения данных.
+    Индекс перестраивается, только если архив изменился (например, после sync).
+    Запись в архив и перестроение индекса выполняются под одной блокировкой:
+    tarfile.open(path, 'a') из двух потоков сразу теряет файлы.
+    """
+
+    def __init__(self, filesystem_path, content_index=False):
+        self.filesystem_path = filesystem_path
+        self.content_index = content_index
+        self.sessions = set()
+        # Повторно входимая: sync сеанса перечитывает индекс, уже держа блокировку
+        self._lock = threading.RLock()
+        self._tar = None
+        self._base = None
+        self._stamp = None
+
+    def get_base(self):
+        with self._lock:
+            stamp = archive_stamp(self.filesystem_path)
+            if self._base is None or stamp != self._stamp:
+                # Старый индекс может ещё использоваться сеансами, поэтому его
+                # отображение архива не закрывается явно
+                if self._tar:
+                    self._tar.close()
+                self._tar = open_backend(self.filesystem_path)
+                self._base = VirtualFileSystem.open_indexed(self._tar, self.filesystem_path)
+                self._stamp = stamp
+            return self._base
+
+    def create_session(self, sink):
+        session = ShellSession(self.filesystem_path, sink=sink, index=self.get_base,
+                               write_lock=self._lock, content_index=self.content_index)
+        self.sessions.add(session)
+        return session
+
+    def release(self, session):
+        self.sessions.discard(session)
+        if not session.closed:
+            session.close_filesystem()
+
+    def close(self):
+        for session in list(self.sessions):
+            self.release(session)
+        if self._tar:
+            self._tar.close()
+            self._base.close()
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = self.create_session(ConnectionSink(loop, writer))
+        try:
+            writer.write(PROMPT.encode('utf-8'))
+            await writer.drain()
+            while not session.closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', errors='ignore').strip()
+                if command == "stats":
+                    for report_line in session.stats.report():
+                        writer.write((report_line + '\n').encode('utf-8'))
+                elif command:
+                    # Команды разных сеансов выполняются параллельно в пуле потоков
+                    await loop.run_in_executor(None, session.execute, command)
+                # Вывод команды поставлен в очередь цикла раньше, чем приглашение
+                writer.write(PROMPT.encode('utf-8'))
+                await writer.drain()
+        finally:
+            await loop.run_in_executor(None, self.release, session)
+            writer.close()
+
+
+async def serve(filesystem_path, socket_path, content_index=False):
+    manager = SessionManager(filesystem_path, content_index)
+    manager.get_base()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(manager.handle_client, path=socket_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        manager.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shell emulator sessions over a local socket")
+    parser.add_argument('config', help="path to config.toml")
+    parser.add_argument('--socket', default='shell_emulator.sock', help="unix socket path")
+    args = parser.parse_args(argv)
+
+    config = read_config(args.config)
+    try:
+        asyncio.run(serve(config['filesystem_path'], args.socket, config['content_index']))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import toml
+
+from backends import open_backend
+from commands import CommandProcessor
+from completion import Completer, History
+from vfs import OverlayFileSystem, ReadCounter, VirtualFileSystem, journal_path
+
+
+def read_config(config_path):
+    config = toml.load(config_path)
+    filesystem = config['filesystem']
+    return {
+        'filesystem_path': filesystem['virtual_filesystem_path'],
+        'start_script_path': filesystem['start_script_path'],
+        'overlay_journal': filesystem.get('overlay_journal', False),
+        'content_index': filesystem.get('content_index', False),
+        'history_path': filesystem.get('history_path'),
+    }
+
+
+class StreamSink:
+    # Вывод команд построчно в текстовый поток (по умолчанию stdout)
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+
+    def write(self, text):
+        self.stream.write(text + '\n')
+
+
+class CommandStats:
+    # Время выполнения команд сеанса, сгруппированное по имени команды
+    def __init__(self):
+        self.commands = {}
+
+    def record(self, name, seconds):
+        count, total, worst = self.commands.get(name, (0, 0.0, 0.0))
+        self.commands[name] = (count + 1, total + seconds, max(worst, seconds))
+
+    def report(self):
+        lines = []
+        for name, (count, total, worst) in sorted(self.commands.items()):
+            lines.append(f"{name}: {count} calls, avg {total / count * 1000:.3f} ms, "
+                         f"max {worst * 1000:.3f} ms")
+        return lines
+
+
+class ShellSession:
+    """
+    Сеанс эмулятора без графического интерфейса: текущий каталог, открытый архив,
+    индекс файловой системы и обработчик команд. Вывод направляется в sink —
+    любой объект с методом write(text). Не зависит от Qt, поэтому в одном процессе
+    можно держать много сеансов. Если передан index — функция, возвращающая общий
+    VirtualFileSystem, — сеанс не строит индекс сам, а держит только свой слой изменений.
+    write_lock сериализует запись в архив, если его разделяют несколько сеансов.
+    """
+
+    def __init__(self, filesystem_path, start_script_path=None, sink=None,
+                 overlay_journal=False, on_close=None, index=None, history_path=None,
+                 write_lock=None, content_index=False):
+        self.filesystem_path = filesystem_path
+        self.start_script_path = start_script_path
+        self.overlay_journal = overlay_journal
+        # grep -r отбирает файлы по триграммному индексу; индекс строится
+        # проходом по данным поддерева, поэтому включается явно
+        self.content_index = content_index
+        self.sink = sink if sink is not None else StreamSink()
+        self.on_close = on_close
+        self.index = index
+        self.write_lock = write_lock if write_lock is not None else threading.RLock()
+        self.stats = CommandStats()
+        self.read_counter = ReadCounter()
+        self.closed = False
+        self.tar = None
+        self.vfs = None
+        self.processor = CommandProcessor()
+        self.history = History(history_path)
+        self.completer = Completer(self)
+        self.load_filesystem()
+
+    @classmethod
+    def from_config(cls, config_path, **kwargs):
+        return cls(**read_config(config_path), **kwargs)
+
+    def display_output(self, text):
+        self.sink.write(text)
+
+    def load_filesystem(self):
+        self.current_directory = "/"
+        if self.tar:
+            self.close_filesystem()
+        self.tar = open_backend(self.filesystem_path)
+        if self.index is not None:
+            base = self.index()
+        else:
+            base = VirtualFileSystem.open_indexed(self.tar, self.filesystem_path)
+        journal = journal_path(self.filesystem_path) if self.overlay_journal else None
+        self.vfs = OverlayFileSystem(base, self.tar, journal_path=journal, counter=self.read_counter)
+
+    def refresh_filesystem(self):
+        """
+        Общий индекс мог быть перестроен после sync другого сеанса. Сеанс
+        переходит на новый индекс и заново открывает архив (сжатый архив при
+        sync заменяется файлом), сохраняя свой слой изменений и текущий каталог.
+        """
+        if self.index is None or self.vfs is None:
+            return
+        base = self.index()
+        if base is not self.vfs.base:
+            self.tar.close()
+            self.tar = open_backend(self.filesystem_path)
+            self.vfs.rebase(base, self.tar)
+
+    def _write_pending(self):
+        # Вызывается под write_lock: индекс сверяется с архивом перед записью
+        self.refresh_filesystem()
+        for path in self.vfs.conflicts():
+            self.display_output(f"File '/{path}' was created by another session, not synced.")
+        return self.vfs.sync()
+
+    def sync_filesystem(self):
+        # Запись изменений и перечитывание архива под одной блокировкой, чтобы
+        # другой сеанс не дописывал архив между ними
+        with self.write_lock:
+            count = self._write_pending()
+            cwd = self.current_directory
+            self.load_filesystem()
+        # Текущий каталог сохраняется, если он есть в перечитанном архиве
+        node = self.vfs.lookup(cwd)
+        if node is not None and node.isdir():
+            self.current_directory = cwd
+        return count
+
+    def close_filesystem(self):
+        # Ошибка записи сообщается, но архив всё равно закрывается, иначе
+        # сеанс нельзя завершить
+        try:
+            if self.vfs is not None and self.vfs.dirty:
+                with self.write_lock:
+                    self._write_pending()
+        except Exception as e:
+            self.display_output(f"Error writing archive: {e}")
+        finally:
+            if self.tar:
+                self.tar.close()
+            # Общий индекс закрывает его владелец, собственный — сеанс
+            if self.vfs is not None and self.index is None:
+                self.vfs.base.close()
+
+    def close(self):
+        self.closed = True
+        if self.on_close is not None:
+            self.on_close()
+
+    def execute(self, command):
+        command = command.strip()
+        if command:
+            started = time.perf_counter()
+            try:
+                self.refresh_filesystem()
+                self.processor.execute(command, self)
+            except Exception as e:
+                self.display_output(f"Error executing command '{command}': {e}")
+            self.stats.record(command.split()[0], time.perf_counter() - started)
+
+    def run_script(self, script_path=None, profile=False):
+        return ScriptRunner(self, profile=profile).run(script_path)
+
+
+class ScriptRunner:
+    """
+    Выполняет команды скрипта в сеансе. В режиме профилирования для каждой
+    команды запоминает время выполнения и число прочитанных из архива байт
+    и в конце выводит отчёт.
+    """
+
+    def __init__(self, session, profile=False):
+        self.session = session
+        self.profile = profile
+        self.records = []
+
+    def run(self, script_path=None):
+        session = self.session
+        script_path = script_path or session.start_script_path
+        if not script_path or not os.path.exists(script_path):
+            session.display_output(f"Start script not found: {script_path}")
+            return self.records
+
+        try:
+            with open(script_path, 'r') as script_file:
+                for line in script_file:
+                    if session.closed or session.processor.cancelled:
+                        break
+                    command = line.strip()
+                    if command:
+                        session.display_output(f"Executing start script command: {command}")
+                        self.run_command(command)
+        except Exception as e:
+            session.display_output(f"Error reading start script: {e}")
+
+        if self.profile:
+            for report_line in self.report():
+                session.display_output(report_line)
+        return self.records
+
+    def run_command(self, command):
+        counter = self.session.read_counter
+        bytes_before = counter.bytes
+        started = time.perf_counter()
+        self.session.execute(command)
+        self.records.append((command, time.perf_counter() - started, counter.bytes - bytes_before))
+
+    def report(self):
+        lines = ["Profile:"]
+        for command, seconds, bytes_read in self.records:
+            lines.append(f"{seconds * 1000:10.3f} ms {bytes_read:12d} B  {command}")
+        total_time = sum(record[1] for record in self.records)
+        total_bytes = sum(record[2] for record in self.records)
+        lines.append(f"{total_time * 1000:10.3f} ms {total_bytes:12d} B  total")
+        return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shell emulator without GUI")
+    parser.add_argument('config', help="path to config.toml")
+    parser.add_argument('--script', help="script to run instead of the configured start script")
+    parser.add_argument('--no-stdin', action='store_true', help="do not read commands from stdin")
+    parser.add_argument('--profile', action='store_true',
+                        help="report wall time and archive bytes read for each script command")
+    args = parser.parse_args(argv)
+
+    session = ShellSession.from_config(args.config)
+    try:
+        session.run_script(args.script, profile=args.profile)
+        if not args.no_stdin:
+            for line in sys.stdin:
+                if session.closed:
+                    break
+                session.execute(line)
+    finally:
+        if not session.closed:
+            session.close_filesystem()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
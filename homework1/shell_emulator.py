@@ -1,24 +1,157 @@
-import os
+import argparse
 import sys
-import tarfile
-from io import BytesIO
 import time
-import toml
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLineEdit, QTextEdit
+from PyQt5.QtCore import QEvent, QRunnable, QThread, QThreadPool, QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPlainTextEdit
+
+from completion import COMPLETION_LIST_LIMIT
+from output import FLUSH_INTERVAL_MS, SCROLLBACK_LINES, OutputBuffer
+from session import ShellSession
+
+class BackgroundTask(QRunnable):
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+
+    def run(self):
+        self.fn(*self.args)
+
+class CommandLineEdit(QLineEdit):
+    """
+    Строка ввода с дополнением по Tab, перемещением по истории стрелками
+    и обратным поиском по истории (Ctrl+R), как в readline.
+    """
+    # Варианты дополнения, если однозначно дополнить слово нельзя
+    candidates_listed = pyqtSignal(list)
+    # Подсказка режима поиска; пустая строка — режим поиска выключен
+    search_prompt_changed = pyqtSignal(str)
+
+    def __init__(self, session, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.history_index = None
+        self.draft = ''
+        self.search_query = None
+        self.search_index = None
+
+    def event(self, event):
+        # Tab обрабатывается здесь, иначе QWidget переведёт фокус на другой виджет
+        if event.type() == QEvent.KeyPress and event.key() == Qt.Key_Tab:
+            self.complete()
+            return True
+        return super().event(event)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        ctrl = bool(event.modifiers() & Qt.ControlModifier)
+        if ctrl and key == Qt.Key_R:
+            self.reverse_search()
+        elif self.search_query is not None and key not in (Qt.Key_Return, Qt.Key_Enter):
+            self.search_key(event)
+        elif key == Qt.Key_Up:
+            self.history_step(-1)
+        elif key == Qt.Key_Down:
+            self.history_step(1)
+        else:
+            if key in (Qt.Key_Return, Qt.Key_Enter):
+                self.end_search()
+                self.history_index = None
+            super().keyPressEvent(event)
+
+    def complete(self):
+        cursor = self.cursorPosition()
+        text = self.text()
+        completed, candidates = self.session.completer.complete(text[:cursor])
+        self.setText(completed + text[cursor:])
+        self.setCursorPosition(len(completed))
+        if len(candidates) > 1:
+            self.candidates_listed.emit(candidates)
+
+    def history_step(self, step):
+        history = self.session.history
+        if not len(history):
+            return
+        if self.history_index is None:
+            if step > 0:
+                return
+            self.draft = self.text()
+            index = len(history)
+        else:
+            index = self.history_index
+        index += step
+        if index >= len(history):
+            self.history_index = None
+            self.setText(self.draft)
+            return
+        self.history_index = max(index, 0)
+        self.setText(history[self.history_index])
+
+    def reverse_search(self):
+        # Первое нажатие включает поиск, повторные ищут более раннее совпадение
+        if self.search_query is None:
+            self.search_query = ''
+            self.search_index = None
+        else:
+            index = self.find_match(self.search_index)
+            if index is not None:
+                self.search_index = index
+        self.update_search()
+
+    def search_key(self, event):
+        key = event.key()
+        if key == Qt.Key_Escape:
+            self.end_search()
+            return
+        if key == Qt.Key_Backspace:
+            self.search_query = self.search_query[:-1]
+        elif event.text() and event.text().isprintable():
+            self.search_query += event.text()
+        else:
+            # Прочие клавиши оставляют найденную команду для редактирования
+            self.end_search()
+            super().keyPressEvent(event)
+            return
+        self.search_index = self.find_match(None)
+        self.update_search()
+
+    def find_match(self, before):
+        return self.session.history.search(self.search_query, before)
+
+    def update_search(self):
+        if self.search_index is not None:
+            self.setText(self.session.history[self.search_index])
+        self.search_prompt_changed.emit(f"(reverse-i-search)`{self.search_query}':")
+
+    def end_search(self):
+        if self.search_query is not None:
+            self.search_query = None
+            self.search_index = None
+            self.search_prompt_changed.emit('')
+
 
 class ShellEmulatorGUI(QWidget):
-    def __init__(self, config_path):
+    # Закрытие окна, запрошенное из рабочего потока, выполняется в GUI-потоке
+    close_requested = pyqtSignal()
+
+    def __init__(self, config_path, profile=False):
         super().__init__()
         self.start_time = time.time()
+        self.profile = profile
+        self.output_buffer = OutputBuffer()
         self.load_config(config_path)
-        self.command_processor = CommandProcessor()
-        self.load_filesystem()
+        self.command_processor = self.session.processor
+        # Один рабочий поток: команды выполняются по очереди, не блокируя окно
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.close_requested.connect(self.close)
 
 
         self.init_ui()
 
 
-        self.execute_start_script()
+        # Скрипт запускается после появления окна и выполняется в рабочем потоке
+        QTimer.singleShot(0, self.execute_start_script)
 
     def init_ui(self):
         self.setWindowTitle('Shell Emulator')
@@ -27,13 +160,25 @@ class ShellEmulatorGUI(QWidget):
         self.layout = QVBoxLayout()
 
 
-        self.output_area = QTextEdit(self)
+        self.output_area = QPlainTextEdit(self)
         self.output_area.setReadOnly(True)
+        self.output_area.setMaximumBlockCount(SCROLLBACK_LINES)
         self.layout.addWidget(self.output_area)
 
-        self.command_input = QLineEdit(self)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush_output)
+        self.flush_timer.start(FLUSH_INTERVAL_MS)
+
+        self.search_label = QLabel(self)
+        self.search_label.hide()
+        self.layout.addWidget(self.search_label)
+
+        self.command_input = CommandLineEdit(self.session, self)
         self.command_input.setPlaceholderText("Enter command here...")
         self.command_input.returnPressed.connect(self.handle_command)
+        self.command_input.candidates_listed.connect(self.show_candidates)
+        self.command_input.search_prompt_changed.connect(self.show_search_prompt)
+        self.command_input.installEventFilter(self)
         self.layout.addWidget(self.command_input)
 
         self.setLayout(self.layout)
@@ -41,209 +186,88 @@ class ShellEmulatorGUI(QWidget):
     def handle_command(self):
         command = self.command_input.text().strip()
         if command:
+            self.session.history.add(command)
             self.execute_command(command)
             self.command_input.clear()
 
+    def show_candidates(self, candidates):
+        shown = candidates[:COMPLETION_LIST_LIMIT]
+        if len(candidates) > len(shown):
+            shown.append(f"... {len(candidates) - len(shown)} more")
+        self.display_output("  ".join(shown))
+
+    def show_search_prompt(self, prompt):
+        self.search_label.setText(prompt)
+        self.search_label.setVisible(bool(prompt))
+
+    def eventFilter(self, obj, event):
+        if (obj is self.command_input and event.type() == QEvent.KeyPress
+                and event.key() == Qt.Key_C and event.modifiers() & Qt.ControlModifier
+                and not self.command_input.hasSelectedText()):
+            self.cancel_command()
+            return True
+        return super().eventFilter(obj, event)
+
+    def cancel_command(self):
+        # Ctrl+C: снимаем ожидающие команды и прерываем выполняемую
+        self.thread_pool.clear()
+        self.command_processor.cancel()
+
+    def close(self):
+        if QThread.currentThread() is not self.thread():
+            self.close_requested.emit()
+            return True
+        return super().close()
+
+    def closeEvent(self, event):
+        self.cancel_command()
+        self.thread_pool.waitForDone()
+        self.session.close_filesystem()
+        super().closeEvent(event)
+
     def display_output(self, text):
-        self.output_area.append(text)
+        self.output_buffer.write(text)
 
-    def load_filesystem(self):
-        self.current_directory = "/"
-        self.tar = tarfile.open(self.filesystem_path, 'r')
+    def flush_output(self):
+        lines = self.output_buffer.drain()
+        if lines:
+            self.output_area.appendPlainText("\n".join(lines))
 
     def load_config(self, config_path):
         try:
-            config = toml.load(config_path)
-            self.filesystem_path = config['filesystem']['virtual_filesystem_path']
-            self.start_script_path = config['filesystem']['start_script_path']
+            self.session = ShellSession.from_config(
+                config_path, sink=self.output_buffer, on_close=self.close
+            )
         except Exception as e:
             self.display_output(f"Error loading config: {e}")
             raise
 
-    def close_filesystem(self):
-        if self.tar:
-            self.tar.close()
+    def run_in_background(self, fn, *args):
+        self.thread_pool.start(BackgroundTask(self._run_task, fn, *args))
 
-    def close_application(self):
-        self.display_output("Exiting emulator...")
-        self.close_filesystem()
-        self.close()
+    def _run_task(self, fn, *args):
+        self.command_processor.reset_cancel()
+        fn(*args)
 
     def execute_command(self, command):
         if command:
-            try:
-                self.command_processor.execute(command, self)
-            except Exception as e:
-                self.display_output(f"Error executing command '{command}': {e}")
-
-    def execute_start_script(self):
-
-        if not os.path.exists(self.start_script_path):
-            self.display_output(f"Start script not found: {self.start_script_path}")
-            return
-
-        try:
-            with open(self.start_script_path, 'r') as script_file:
-                for line in script_file:
-                    command = line.strip()
-                    if command:
-                        self.display_output(f"Executing start script command: {command}")
-                        self.execute_command(command)
-        except Exception as e:
-            self.display_output(f"Error reading start script: {e}")
-
-class CommandProcessor:
-    def __init__(self):
-        self.start_time = time.time()
-
-    def execute(self, command, shell):
-        cmd_parts = command.split()
-        cmd_name = cmd_parts[0]
-        args = cmd_parts[1:]
-
-        if cmd_name == "ls":
-            self.ls(shell)
-        elif cmd_name == "cd":
-            self.cd(shell, args)
-        elif cmd_name == "whoami":
-            self.whoami(shell)
-        elif cmd_name == "tac":
-            self.tac(shell, args)
-        elif cmd_name == "touch":
-            self.touch(shell, args)
-        elif cmd_name == "exit":
-            self.close_application(shell)
-        else:
-            shell.display_output(f"Command '{cmd_name}' is not supported.")
-
-    def close_application(self, shell):
-        shell.display_output("Exiting emulator...")
-        shell.close_filesystem()
-        shell.close()
-
-    def ls(self, shell):
-        current_dir = shell.current_directory.strip('/')
-        if not current_dir:
-            current_dir = "."
-        contents = []
-        for member in shell.tar.getmembers():
-            member_path = member.name.strip('/')
-            if current_dir == "." and '/' not in member_path:
-                contents.append(member_path)
-            elif member_path.startswith(current_dir + '/'):
-                relative_path = member_path[len(current_dir) + 1:]
-                if '/' not in relative_path:
-                    contents.append(relative_path)
-
-        if contents:
-            shell.display_output("\n".join(contents))
-        else:
-            shell.display_output("No files or directories in the current directory.")
-
-    def cd(self, shell, args):
-        if not args:
-            shell.display_output("No directory specified.")
-            return
-
-        path = args[0]
-        if path == "..":
-            if shell.current_directory != "/":
-                shell.current_directory = os.path.dirname(shell.current_directory.rstrip('/'))
-                if not shell.current_directory or shell.current_directory == "":
-                    shell.current_directory = "/"
-                shell.display_output(f"Current directory: {shell.current_directory}")
-            else:
-                shell.display_output("You are already at the root directory.")
-            return
-
-        if path.startswith('/'):
-            path = path[1:]
-
-        new_dir = os.path.join(shell.current_directory, path).strip('/')
-        if new_dir and not new_dir.startswith('/'):
-            new_dir = "/" + new_dir
-
-        try:
-            dir_exists = any(
-                member.name.rstrip('/') == new_dir.strip('/')
-                for member in shell.tar.getmembers()
-                if member.isdir()
-            )
-
-            if dir_exists:
-                shell.current_directory = new_dir + "/"
-                if shell.current_directory == "//":
-                    shell.current_directory = "/"
-                shell.display_output(f"Current directory: {shell.current_directory}")
-            else:
-                shell.display_output(f"Directory '{path}' not found.")
-        except Exception as e:
-            shell.display_output(f"Error accessing archive: {e}")
-
-    def whoami(self, shell):
-        try:
-            user = os.getlogin()
-            shell.display_output(user)
-        except Exception as e:
-            shell.display_output(f"Error executing command 'whoami': {e}")
-
-    def tac(self, shell, args):
-        if not args:
-            shell.display_output("No file specified.")
-            return
-
-        filename = args[0]
-        try:
-            file_found = False
-            for member in shell.tar.getmembers():
-                if filename == os.path.basename(member.name):
-                    file_found = True
-                    if member.isfile():
-                        file_data = shell.tar.extractfile(member).read()
-                        try:
-                            file_data = file_data.decode('utf-8', errors='ignore')
-                        except UnicodeDecodeError:
-
-                            file_data = file_data.decode('ASCII', errors='ignore')
-                        lines = file_data.splitlines()
-                        if lines:
-                            for line in reversed(lines):
-                                shell.display_output(line)
-                    break
-
-            if not file_found:
-                shell.display_output(f"File '{filename}' not found.")
-        except Exception as e:
-            shell.display_output(f"Error opening archive: {e}")
-
-    def touch(self, shell, args):
-        if not args:
-            shell.display_output("No file name specified.")
-            return
+            self.run_in_background(self.run_command, command)
 
-        filename = args[0]
-        full_path = os.path.join(shell.current_directory.strip('/'), filename).strip('/')
+    def run_command(self, command):
+        self.session.execute(command)
 
-        try:
-            shell.tar.close()
-            with tarfile.open(shell.filesystem_path, mode='a') as tar:
-                if any(member.name == full_path for member in tar.getmembers()):
-                    shell.display_output(f"File '{filename}' already exists.")
-                    return
-                file_data = BytesIO(b'')
-                tar_info = tarfile.TarInfo(name=full_path)
-                tar_info.size = 0
-                tar_info.mtime = time.time()
-                tar.addfile(tarinfo=tar_info, fileobj=file_data)
-
-            shell.load_filesystem()
-            shell.display_output(f"File '{filename}' created successfully.")
-        except Exception as e:
-            shell.display_output(f"Error creating or updating file: {e}")
+    def execute_start_script(self):
+        self.run_in_background(self.session.run_script, None, self.profile)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    emulator_gui = ShellEmulatorGUI("/Users/matvej/PycharmProjects/dz1/config.toml")
+    parser = argparse.ArgumentParser(description="Shell emulator")
+    parser.add_argument('config', nargs='?', default="/Users/matvej/PycharmProjects/dz1/config.toml")
+    parser.add_argument('--profile', action='store_true',
+                        help="report wall time and archive bytes read for each start script command")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    emulator_gui = ShellEmulatorGUI(args.config, profile=args.profile)
     emulator_gui.show()
     sys.exit(app.exec_())
 
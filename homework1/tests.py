@@ -1,25 +1,47 @@
+import asyncio
+import gzip
+import threading
+import mmap
+import random
 import unittest
+import zipfile
 from unittest.mock import patch
 import tarfile
 import tempfile
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
 
-from shell_emulator import CommandProcessor
+import benchmark
+from commands import CommandProcessor, split_pipeline, tokenize
+from backends import DirectoryArchive, TarArchive, ZipArchive, open_backend
+from completion import History
+from compressed import (CheckpointedGzipReader, CompressedTarFile, build_seek_points, open_archive,
+                        read_seek_index, seek_index_path)
+from output import OutputBuffer
+from server import PROMPT, SessionManager
+from session import ShellSession, StreamSink
+from vfs import (ArchiveMap, OverlayFileSystem, VirtualFileSystem, get_vfs, index_path, iter_reverse_lines,
+                 read_index, write_index)
 
 class MockShell:
     def __init__(self, tar_path):
         self.current_directory = "/"
         self.displayed_output = []
         self.filesystem_path = tar_path
-        self.tar = tarfile.open(self.filesystem_path, 'r')
+        self.content_index = False
+        self.tar = open_backend(self.filesystem_path)
 
     def display_output(self, text):
         self.displayed_output.append(text)
 
     def load_filesystem(self):
         self.tar.close()
-        self.tar = tarfile.open(self.filesystem_path, 'r')
+        self.tar = open_backend(self.filesystem_path)
+
+    def sync_filesystem(self):
+        count = get_vfs(self).sync()
+        self.load_filesystem()
+        return count
 
     def close_filesystem(self):
         if self.tar:
@@ -92,6 +114,14 @@ class TestCommandProcessor(unittest.TestCase):
         self.command_processor.cd(self.mock_shell, ["nonexistent"])
         self.assertIn("Directory 'nonexistent' not found.", self.mock_shell.displayed_output)
 
+    def test_cd_absolute_and_dot_paths(self):
+        self.command_processor.cd(self.mock_shell, ["/dir1/."])
+        self.assertEqual(self.mock_shell.current_directory, "/dir1/")
+        self.command_processor.cd(self.mock_shell, ["../dir1/../"])
+        self.assertEqual(self.mock_shell.current_directory, "/")
+        self.command_processor.cd(self.mock_shell, ["file1.txt"])
+        self.assertIn("Directory 'file1.txt' not found.", self.mock_shell.displayed_output)
+
     def test_cd_to_parent_directory(self):
         # Сначала переходим в поддиректорию
         self.command_processor.cd(self.mock_shell, ["dir1"])
@@ -101,12 +131,12 @@ class TestCommandProcessor(unittest.TestCase):
         self.assertIn("Current directory: /", self.mock_shell.displayed_output)
 
     # Тесты для команды whoami
-    @patch('shell_emulator.os.getlogin', return_value='testuser')
+    @patch('commands.os.getlogin', return_value='testuser')
     def test_whoami_normal(self, mock_getlogin):
         self.command_processor.whoami(self.mock_shell)
         self.assertIn("testuser", self.mock_shell.displayed_output)
 
-    @patch('shell_emulator.os.getlogin', side_effect=OSError("Cannot determine user"))
+    @patch('commands.os.getlogin', side_effect=OSError("Cannot determine user"))
     def test_whoami_no_user(self, mock_getlogin):
         self.command_processor.whoami(self.mock_shell)
         self.assertIn("Error executing command 'whoami': Cannot determine user", self.mock_shell.displayed_output)
@@ -145,11 +175,66 @@ class TestCommandProcessor(unittest.TestCase):
         # Проверяем, что ничего не добавилось
         self.assertEqual(len(self.mock_shell.displayed_output), initial_output_length)
 
+    def test_tac_multiline_file_reversed(self):
+        content = "".join(f"line {i}\n" for i in range(1000)).encode()
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tarinfo = tarfile.TarInfo(name="dir1/log.txt")
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, BytesIO(content))
+        self.mock_shell.load_filesystem()
+
+        self.command_processor.tac(self.mock_shell, ["dir1/log.txt"])
+        expected = [f"line {i}" for i in reversed(range(1000))]
+        self.assertEqual(self.mock_shell.displayed_output, expected)
+
+    def test_tac_cancelled(self):
+        content = "".join(f"line {i}\n" for i in range(100)).encode()
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tarinfo = tarfile.TarInfo(name="long.txt")
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, BytesIO(content))
+        self.mock_shell.load_filesystem()
+
+        # Ctrl+C приходит после первой выведенной строки
+        display_output = self.mock_shell.display_output
+        def cancel_after_output(text):
+            display_output(text)
+            self.command_processor.cancel()
+        self.mock_shell.display_output = cancel_after_output
+
+        self.command_processor.tac(self.mock_shell, ["long.txt"])
+        self.assertEqual(self.mock_shell.displayed_output, ["line 99", "^C"])
+
+    def test_tac_resolves_relative_to_current_directory(self):
+        # Файл с тем же именем в другом каталоге не должен перехватывать поиск
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tarinfo = tarfile.TarInfo(name="dir1/file1.txt")
+            tarinfo.size = len(b"nested\n")
+            tar.addfile(tarinfo, BytesIO(b"nested\n"))
+        self.mock_shell.load_filesystem()
+
+        self.command_processor.execute("cd dir1", self.mock_shell)
+        self.command_processor.execute("tac file1.txt", self.mock_shell)
+        self.command_processor.execute("tac ../file1.txt", self.mock_shell)
+        self.command_processor.execute("tac /dir1/./file1.txt", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output[1:], ["nested", "Hello World", "nested"])
+
+    def test_tac_directory(self):
+        self.command_processor.tac(self.mock_shell, ["dir1"])
+        self.assertIn("'dir1' is a directory.", self.mock_shell.displayed_output)
+
     # Тесты для команды touch
     def test_touch_new_file(self):
         self.command_processor.touch(self.mock_shell, ["newfile.txt"])
         self.assertIn("File 'newfile.txt' created successfully.", self.mock_shell.displayed_output)
-        # Проверяем, что файл появился в tar
+        # До sync архив не меняется, файл виден только через слой
+        with tarfile.open(self.temp_tar.name, "r") as tar:
+            self.assertNotIn("newfile.txt", tar.getnames())
+        self.command_processor.ls(self.mock_shell)
+        self.assertIn("newfile.txt", self.mock_shell.displayed_output[-1])
+        # Проверяем, что файл появился в tar после sync
+        self.command_processor.execute("sync", self.mock_shell)
+        self.assertIn("Synced 1 file(s) to archive.", self.mock_shell.displayed_output)
         with tarfile.open(self.temp_tar.name, "r") as tar:
             self.assertIn("newfile.txt", tar.getnames())
 
@@ -161,6 +246,168 @@ class TestCommandProcessor(unittest.TestCase):
         self.command_processor.touch(self.mock_shell, [])
         self.assertIn("No file name specified.", self.mock_shell.displayed_output)
 
+    def test_touch_in_missing_directory(self):
+        self.command_processor.touch(self.mock_shell, ["nodir/new.txt"])
+        self.assertIn("Directory 'nodir' not found.", self.mock_shell.displayed_output)
+        self.command_processor.touch(self.mock_shell, ["dir1/new.txt"])
+        self.assertIsNotNone(get_vfs(self.mock_shell).lookup("/dir1/new.txt"))
+
+    def test_touch_twice_reports_existing(self):
+        self.command_processor.touch(self.mock_shell, ["newfile.txt"])
+        self.command_processor.touch(self.mock_shell, ["newfile.txt"])
+        self.assertIn("File 'newfile.txt' already exists.", self.mock_shell.displayed_output)
+
+    # Тесты для команды sync
+    def test_sync_nothing_pending(self):
+        self.command_processor.execute("sync", self.mock_shell)
+        self.assertIn("Nothing to sync.", self.mock_shell.displayed_output)
+
+    def test_touch_survives_reload_before_sync(self):
+        self.command_processor.touch(self.mock_shell, ["newfile.txt"])
+        self.mock_shell.load_filesystem()
+        self.command_processor.tac(self.mock_shell, ["newfile.txt"])
+        self.assertNotIn("File 'newfile.txt' not found.", self.mock_shell.displayed_output)
+
+    # Тесты для конвейеров и команды head
+    def add_log(self, lines):
+        content = "".join(f"line {i}\n" for i in range(lines)).encode()
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tarinfo = tarfile.TarInfo(name="dir1/log.txt")
+            tarinfo.size = len(content)
+            tar.addfile(tarinfo, BytesIO(content))
+        self.mock_shell.load_filesystem()
+
+    def test_head_file(self):
+        self.add_log(50)
+        self.command_processor.execute("head -n 2 dir1/log.txt", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["line 0", "line 1"])
+
+    def test_pipeline_tac_head(self):
+        self.add_log(50)
+        self.command_processor.execute("tac dir1/log.txt | head -n 3", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["line 49", "line 48", "line 47"])
+
+    def test_pipeline_stops_upstream(self):
+        state = {"produced": 0, "closed": False}
+        def numbers(shell, args, stdin):
+            try:
+                while True:
+                    state["produced"] += 1
+                    yield str(state["produced"])
+            finally:
+                state["closed"] = True
+        self.command_processor.register("numbers", stream=numbers)
+
+        self.command_processor.execute("numbers | head -2", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["1", "2"])
+        self.assertEqual(state["produced"], 2)
+        self.assertTrue(state["closed"])
+
+    def test_pipeline_rejects_non_stream_command(self):
+        self.command_processor.execute("ls | cd dir1", self.mock_shell)
+        self.assertIn("Command 'cd' cannot be used in a pipeline.", self.mock_shell.displayed_output)
+        self.command_processor.execute("ls |", self.mock_shell)
+        self.assertIn("Syntax error near '|'.", self.mock_shell.displayed_output)
+
+    def test_tokenize_quotes_and_pipes(self):
+        self.assertEqual(tokenize('touch "a b.txt"|head'), ["touch", "a b.txt", "|", "head"])
+        self.assertEqual(tokenize("tac 'x|y'"), ["tac", "x|y"])
+        # '#' не начинает комментарий
+        self.assertEqual(tokenize("touch a#b"), ["touch", "a#b"])
+        self.assertEqual(tokenize("grep #include f"), ["grep", "#include", "f"])
+        self.assertEqual(tokenize('grep "||" f'), ["grep", "||", "f"])
+        self.assertEqual(tokenize('touch a\\ b "c\\"d" \'e\\f\' ""'), ["touch", "a b", 'c"d', "e\\f", ""])
+        with self.assertRaises(ValueError):
+            tokenize("touch 'a")
+        with self.assertRaises(ValueError):
+            tokenize("a||b")
+        self.command_processor.execute("ls||head", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["Syntax error: unexpected '||'"])
+
+    def test_quoted_pipe_is_not_an_operator(self):
+        self.assertEqual(split_pipeline(tokenize('grep "|" file1.txt')), [["grep", "|", "file1.txt"]])
+        self.assertEqual(split_pipeline(tokenize("ls | grep '|'")), [["ls"], ["grep", "|"]])
+        get_vfs(self.mock_shell).write_file("/pipes.txt", b"a | b\nplain\n")
+        self.command_processor.execute('grep "|" pipes.txt', self.mock_shell)
+        self.assertNotIn("Command 'pipes.txt' is not supported.", self.mock_shell.displayed_output)
+        self.mock_shell.displayed_output.clear()
+        self.command_processor.execute('grep "[|]" pipes.txt', self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["a | b"])
+
+    # Тесты для команд find и grep
+    def test_find_by_name_and_glob(self):
+        self.command_processor.execute("find file2.txt", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["/dir1/file2.txt"])
+        self.command_processor.execute("find / -name '*.txt'", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output[1:], ["/file1.txt", "/dir1/file2.txt"])
+
+    def test_find_limited_to_directory(self):
+        self.command_processor.execute("cd dir1", self.mock_shell)
+        self.command_processor.execute("find file1.txt", self.mock_shell)
+        self.command_processor.execute("find nodir x", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output[1:], ["Directory 'nodir' not found."])
+
+    def test_grep_file_and_stdin(self):
+        self.command_processor.execute("grep World file1.txt", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["Hello World"])
+        self.command_processor.execute("ls | grep '^s'", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output[1:], ["script.sh"])
+
+    def test_grep_recursive_uses_content_index(self):
+        self.mock_shell.content_index = True
+        self.command_processor.execute("grep -r file /", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["/dir1/file2.txt:Another file"])
+        index = get_vfs(self.mock_shell).content_index()
+        self.assertEqual(index.candidates(b"Start"), {get_vfs(self.mock_shell).lookup("script.sh")})
+        self.assertEqual(index.candidates(b"missing"), set())
+
+    def test_content_index_covers_only_requested_subtree(self):
+        self.mock_shell.content_index = True
+        self.command_processor.execute("grep -r file dir1", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["/dir1/file2.txt:Another file"])
+        vfs = get_vfs(self.mock_shell)
+        self.assertEqual(vfs.base._content_index.indexed, {vfs.lookup("dir1/file2.txt")})
+        # Повторный запрос к тому же поддереву ничего не дочитывает
+        index = vfs.content_index("/dir1")
+        self.assertEqual(index.indexed, {vfs.lookup("dir1/file2.txt")})
+        self.assertEqual(len(vfs.content_index("/").indexed), 3)
+
+    @patch('vfs.CONTENT_INDEX_MAX_TRIGRAMS', 5)
+    def test_content_index_skips_files_with_many_trigrams(self):
+        self.mock_shell.content_index = True
+        self.command_processor.execute("grep -r file /", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["/dir1/file2.txt:Another file"])
+        self.assertEqual(get_vfs(self.mock_shell).content_index().indexed, set())
+
+    def test_grep_without_content_index_does_not_build_it(self):
+        self.command_processor.execute("grep -r file /", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["/dir1/file2.txt:Another file"])
+        self.assertIsNone(get_vfs(self.mock_shell).base._content_index)
+
+    def test_du_uses_subtree_aggregates(self):
+        self.command_processor.execute("du", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["13\t./dir1", "36\t."])
+        # touch обновляет агрегаты без пересчёта
+        self.command_processor.execute("touch dir1/new.txt", self.mock_shell)
+        get_vfs(self.mock_shell).write_file("dir1/file2.txt", b"x" * 100)
+        self.assertEqual(get_vfs(self.mock_shell).usage("/dir1"), (100, 2))
+        self.assertEqual(get_vfs(self.mock_shell).usage("/"), (123, 4))
+
+    def test_tree_with_depth_limit(self):
+        self.command_processor.execute("tree", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, [
+            "[    36]  .",
+            "├── [    13]  dir1",
+            "│   └── [    13]  file2.txt",
+            "├── [    12]  file1.txt",
+            "└── [    11]  script.sh",
+            "",
+            "1 directories, 3 files",
+        ])
+        self.mock_shell.displayed_output.clear()
+        self.command_processor.execute("tree -L 1 dir1 | head -n 2", self.mock_shell)
+        self.assertEqual(self.mock_shell.displayed_output, ["[    13]  dir1", "└── [    13]  file2.txt"])
+
     # Тесты для команды exit
     def test_exit_command(self):
         self.command_processor.execute("exit", self.mock_shell)
@@ -180,5 +427,616 @@ class TestCommandProcessor(unittest.TestCase):
         self.assertIn("Exiting emulator...", self.mock_shell.displayed_output)
         self.assertIn("Shell closed.", self.mock_shell.displayed_output)
 
+class TestShellSession(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.temp_dir.name, "vfs.tar")
+        with tarfile.open(self.tar_path, "w") as tar:
+            tarinfo = tarfile.TarInfo(name="dir1/file2.txt")
+            tarinfo.size = len(b"one\ntwo\n")
+            tar.addfile(tarinfo, BytesIO(b"one\ntwo\n"))
+        self.script_path = os.path.join(self.temp_dir.name, "start.sh")
+        self.output = StringIO()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_session(self, script):
+        with open(self.script_path, "w") as f:
+            f.write(script)
+        return ShellSession(self.tar_path, self.script_path, sink=StreamSink(self.output))
+
+    def test_run_script_writes_to_stream(self):
+        session = self.make_session("cd dir1\ntac file2.txt\n")
+        session.run_script()
+        self.assertEqual(self.output.getvalue().splitlines(), [
+            "Executing start script command: cd dir1",
+            "Current directory: /dir1/",
+            "Executing start script command: tac file2.txt",
+            "two",
+            "one",
+        ])
+        session.close_filesystem()
+
+    def test_exit_stops_script_and_syncs(self):
+        session = self.make_session("touch new.txt\nexit\nls\n")
+        session.run_script()
+        self.assertTrue(session.closed)
+        self.assertNotIn("Executing start script command: ls", self.output.getvalue())
+        with tarfile.open(self.tar_path, "r") as tar:
+            self.assertIn("new.txt", tar.getnames())
+
+    def test_profile_reports_time_and_bytes(self):
+        session = self.make_session("cd dir1\ntac file2.txt\n")
+        records = session.run_script(profile=True)
+        self.assertEqual([(command, bytes_read) for command, _, bytes_read in records],
+                         [("cd dir1", 0), ("tac file2.txt", len(b"one\ntwo\n"))])
+        lines = self.output.getvalue().splitlines()
+        self.assertIn("Profile:", lines)
+        self.assertTrue(lines[-1].endswith(" 8 B  total"))
+        session.close_filesystem()
+
+    def test_plain_archive_read_through_memory_map(self):
+        session = self.make_session("")
+        node = session.vfs.lookup("/dir1/file2.txt")
+        self.assertIsNotNone(session.vfs.base.archive_map)
+        view = session.vfs.read_view(node)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(view.tobytes(), b"one\ntwo\n")
+        self.assertEqual([bytes(line) for line in session.vfs.iter_lines_reversed(node)], [b"two", b"one"])
+        view.release()
+
+        # Файл слоя изменений читается из памяти, а не из отображения
+        session.execute("touch dir1/new.txt")
+        self.assertIsNone(session.vfs.read_view(session.vfs.lookup("/dir1/new.txt")))
+        session.close_filesystem()
+
+    def test_missing_script(self):
+        session = ShellSession(self.tar_path, "missing.sh", sink=StreamSink(self.output))
+        session.run_script()
+        self.assertIn("Start script not found: missing.sh", self.output.getvalue())
+        session.close_filesystem()
+
+class TestCompletion(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.temp_dir.name, "vfs.tar")
+        with tarfile.open(self.tar_path, "w") as tar:
+            for name in ("docs/readme.txt", "docs/report.txt", "data/a.csv"):
+                tar.addfile(tarfile.TarInfo(name=name), BytesIO(b""))
+        self.session = ShellSession(self.tar_path, sink=StreamSink(StringIO()))
+
+    def tearDown(self):
+        self.session.close_filesystem()
+        self.temp_dir.cleanup()
+
+    def test_command_names(self):
+        self.assertEqual(self.session.completer.complete("wh"), ("whoami ", []))
+        self.assertEqual(self.session.completer.complete("ls | gr"), ("ls | grep ", []))
+        self.assertEqual(self.session.completer.complete("to"), ("touch ", []))
+        self.assertEqual(self.session.completer.complete("t"), ("t", ["tac", "touch", "tree"]))
+
+    def test_paths_relative_to_current_directory(self):
+        completer = self.session.completer
+        self.assertEqual(completer.complete("cd do"), ("cd docs/", []))
+        self.assertEqual(completer.complete("tac docs/re"), ("tac docs/re", ["readme.txt", "report.txt"]))
+        self.session.execute("cd docs")
+        self.assertEqual(completer.complete("tac rea"), ("tac readme.txt ", []))
+        self.assertEqual(completer.complete("ls ../d"), ("ls ../d", ["data", "docs"]))
+        self.assertEqual(completer.complete("ls missing/"), ("ls missing/", []))
+
+    def test_overlay_files_are_completed(self):
+        self.session.execute("touch docs/rest.txt")
+        self.assertEqual(self.session.vfs.complete("/docs", "re"), ["readme.txt", "report.txt", "rest.txt"])
+
+    def test_history_persisted_and_searched(self):
+        history_path = os.path.join(self.temp_dir.name, "history")
+        history = History(history_path)
+        for command in ("ls", "cd docs", "cd docs", "tac readme.txt", "cd /"):
+            history.add(command)
+        restored = History(history_path)
+        self.assertEqual(restored.entries, ["ls", "cd docs", "tac readme.txt", "cd /"])
+        index = restored.search("cd")
+        self.assertEqual(restored[index], "cd /")
+        self.assertEqual(restored[restored.search("cd", index)], "cd docs")
+        self.assertIsNone(restored.search("cd", 1))
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output = StringIO()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_session(self, image_path):
+        session = ShellSession(image_path, sink=StreamSink(self.output))
+        session.execute("ls")
+        session.execute("cd dir1")
+        session.execute("tac file2.txt")
+        session.execute("touch new.txt")
+        session.execute("sync")
+        session.execute("ls")
+        self.assertEqual(self.output.getvalue().splitlines(), [
+            "dir1",
+            "Current directory: /dir1/",
+            "two",
+            "one",
+            "File 'new.txt' created successfully.",
+            "Synced 1 file(s) to archive.",
+            "file2.txt",
+            "new.txt",
+        ])
+        session.close_filesystem()
+        self.assertFalse(os.path.exists(index_path(image_path)))
+
+    def test_zip_image(self):
+        zip_path = os.path.join(self.temp_dir.name, "vfs.zip")
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr("dir1/file2.txt", b"one\ntwo\n")
+        self.check_session(zip_path)
+        session = ShellSession(zip_path, sink=StreamSink(StringIO()))
+        self.assertIsInstance(session.tar, ZipArchive)
+        session.close_filesystem()
+        with zipfile.ZipFile(zip_path) as zf:
+            self.assertEqual(zf.namelist(), ["dir1/file2.txt", "dir1/new.txt"])
+
+    def test_zip_members_reversed_without_backward_seeks(self):
+        zip_path = os.path.join(self.temp_dir.name, "vfs.zip")
+        content = b"".join(b"line %d\n" % i for i in range(20000))
+        with zipfile.ZipFile(zip_path, "w") as zf:
+            zf.writestr(zipfile.ZipInfo("stored.txt"), content, compress_type=zipfile.ZIP_STORED)
+            zf.writestr(zipfile.ZipInfo("deflated.txt"), content, compress_type=zipfile.ZIP_DEFLATED)
+        session = ShellSession(zip_path, sink=StreamSink(StringIO()))
+        expected = content.splitlines()[::-1]
+
+        # Несжатый член читается из отображения архива по смещению данных
+        stored = session.vfs.resolve("/", "stored.txt")
+        self.assertEqual(bytes(session.vfs.read_view(stored)), content)
+        self.assertEqual([bytes(line) for line in session.vfs.iter_lines_reversed(stored)], expected)
+
+        # Сжатый член распаковывается один раз, без переходов назад
+        deflated = session.vfs.resolve("/", "deflated.txt")
+        self.assertIsNone(session.vfs.read_view(deflated))
+        with patch("zipfile.ZipExtFile.seek", side_effect=AssertionError("backward seek")):
+            self.assertEqual(list(session.vfs.iter_lines_reversed(deflated)), expected)
+        session.close_filesystem()
+
+    def test_xz_member_reversed_in_one_pass(self):
+        xz_path = os.path.join(self.temp_dir.name, "vfs.tar.xz")
+        content = b"".join(b"line %d\n" % i for i in range(20000))
+        with tarfile.open(xz_path, "w:xz") as tar:
+            info = tarfile.TarInfo("big.txt")
+            info.size = len(content)
+            tar.addfile(info, BytesIO(content))
+        session = ShellSession(xz_path, sink=StreamSink(StringIO()))
+        self.assertIsInstance(session.tar, TarArchive)
+        self.assertFalse(session.tar.mappable)
+        self.assertFalse(session.tar.seeks_backward_cheaply)
+        node = session.vfs.resolve("/", "big.txt")
+        with patch("lzma.LZMAFile.seek", wraps=session.tar.tar.fileobj.seek) as seek:
+            self.assertEqual(list(session.vfs.iter_lines_reversed(node)), content.splitlines()[::-1])
+        # Поток xz читается только вперёд
+        positions = [call.args[0] for call in seek.call_args_list]
+        self.assertEqual(positions, sorted(positions))
+        session.close_filesystem()
+
+    def test_host_directory_image(self):
+        root = os.path.join(self.temp_dir.name, "root")
+        os.makedirs(os.path.join(root, "dir1"))
+        with open(os.path.join(root, "dir1", "file2.txt"), "wb") as f:
+            f.write(b"one\ntwo\n")
+        self.check_session(root)
+        self.assertIsInstance(ShellSession(root, sink=StreamSink(StringIO())).tar, DirectoryArchive)
+        self.assertTrue(os.path.isfile(os.path.join(root, "dir1", "new.txt")))
+
+class TestSessionManager(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.temp_dir.name, "vfs.tar")
+        self.socket_path = os.path.join(self.temp_dir.name, "shell.sock")
+        with tarfile.open(self.tar_path, "w") as tar:
+            for name in ("dir1/a.txt", "dir2/b.txt"):
+                tar.addfile(tarfile.TarInfo(name=name), BytesIO(b""))
+        self.manager = SessionManager(self.tar_path)
+
+    def tearDown(self):
+        self.manager.close()
+        self.temp_dir.cleanup()
+
+    async def send(self, reader, writer, command):
+        writer.write((command + "\n").encode())
+        data = await reader.readuntil(PROMPT.encode())
+        return data.decode()[:-len(PROMPT)].splitlines()
+
+    async def scenario(self):
+        server = await asyncio.start_unix_server(self.manager.handle_client, path=self.socket_path)
+        async with server:
+            first = await asyncio.open_unix_connection(self.socket_path)
+            second = await asyncio.open_unix_connection(self.socket_path)
+            for reader, _ in (first, second):
+                await reader.readuntil(PROMPT.encode())
+
+            self.assertEqual(await self.send(*first, "cd dir1"), ["Current directory: /dir1/"])
+            self.assertEqual(await self.send(*second, "cd dir2"), ["Current directory: /dir2/"])
+            self.assertEqual(await self.send(*first, "touch c.txt"), ["File 'c.txt' created successfully."])
+            self.assertEqual(await self.send(*first, "ls"), ["a.txt", "c.txt"])
+            self.assertEqual(await self.send(*second, "ls"), ["b.txt"])
+
+            stats = await self.send(*first, "stats")
+            self.assertEqual([line.split(":")[0] for line in stats], ["cd", "ls", "touch"])
+
+            sessions = list(self.manager.sessions)
+            self.assertEqual(len(sessions), 2)
+            self.assertIs(sessions[0].vfs.base, sessions[1].vfs.base)
+            self.assertIsNot(sessions[0].vfs, sessions[1].vfs)
+
+            for _, writer in (first, second):
+                writer.close()
+                await writer.wait_closed()
+
+    def test_sessions_share_index(self):
+        asyncio.run(self.scenario())
+
+    def test_sessions_see_files_synced_by_others(self):
+        first_output, second_output = StringIO(), StringIO()
+        first = self.manager.create_session(StreamSink(first_output))
+        second = self.manager.create_session(StreamSink(second_output))
+        # Оба сеанса создают y.txt до того, как кто-то из них сохранил изменения
+        first.execute("touch y.txt")
+        second.execute("touch y.txt")
+        first.execute("touch x.txt")
+        first.execute("sync")
+
+        second.execute("ls")
+        self.assertIn("x.txt", second_output.getvalue().splitlines())
+        second.execute("touch x.txt")
+        self.assertIn("File 'x.txt' already exists.", second_output.getvalue())
+        second.execute("sync")
+        self.assertIn("File '/y.txt' was created by another session, not synced.", second_output.getvalue())
+
+        with tarfile.open(self.tar_path) as tar:
+            self.assertEqual(sorted(tar.getnames()), ["dir1/a.txt", "dir2/b.txt", "x.txt", "y.txt"])
+        for session in (first, second):
+            self.manager.release(session)
+
+    def test_concurrent_sync_keeps_all_files(self):
+        sessions = [self.manager.create_session(StreamSink(StringIO())) for _ in range(4)]
+        for i, session in enumerate(sessions):
+            session.execute(f"touch new{i}.txt")
+        barrier = threading.Barrier(len(sessions))
+
+        def sync(session):
+            barrier.wait()
+            session.execute("sync")
+
+        threads = [threading.Thread(target=sync, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with tarfile.open(self.tar_path) as tar:
+            names = tar.getnames()
+        self.assertEqual(sorted(name for name in names if name.startswith("new")),
+                         [f"new{i}.txt" for i in range(4)])
+        # Индекс перестроен по архиву со всеми записанными файлами
+        self.assertIsNotNone(self.manager.get_base().resolve("/", "new3.txt"))
+
+class TestCompressedArchive(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.tar_path = os.path.join(self.temp_dir.name, "vfs.tar.gz")
+        self.content = "".join(f"line {i}\n" for i in range(5000)).encode()
+        with tarfile.open(self.tar_path, "w:gz") as tar:
+            for i in range(20):
+                tar.addfile(tarfile.TarInfo(name=f"dir{i}/empty.txt"), BytesIO(b""))
+            tarinfo = tarfile.TarInfo(name="logs/app.log")
+            tarinfo.size = len(self.content)
+            tar.addfile(tarinfo, BytesIO(self.content))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_random_access_matches_stream(self):
+        with gzip.open(self.tar_path) as f:
+            expected = f.read()
+        reader = CheckpointedGzipReader(self.tar_path, spacing=4096)
+        for pos, size in ((50000, 100), (10, 5000), (len(expected) - 3, 10), (4095, 2)):
+            reader.seek(pos)
+            self.assertEqual(reader.read(size), expected[pos:pos + size])
+        self.assertEqual(reader.seek(0, os.SEEK_END), len(expected))
+        self.assertGreater(len(reader._positions), 2)
+        reader.close()
+
+    def test_multi_member_gzip(self):
+        path = os.path.join(self.temp_dir.name, "multi.gz")
+        with open(path, "wb") as f:
+            f.write(gzip.compress(b"abc" * 1000) + gzip.compress(b"def" * 1000))
+        reader = CheckpointedGzipReader(path, spacing=500)
+        self.assertEqual(reader.read(), b"abc" * 1000 + b"def" * 1000)
+        reader.seek(2999)
+        self.assertEqual(reader.read(3), b"cde")
+        reader.close()
+
+    def test_seek_points_restore_at_any_bit(self):
+        path = os.path.join(self.temp_dir.name, "words.gz")
+        rng = random.Random(1)
+        words = ["".join(rng.choice("abcdefghij") for _ in range(rng.randint(2, 8))) for _ in range(3000)]
+        expected = " ".join(rng.choice(words) for _ in range(200000)).encode()
+        with open(path, "wb") as f:
+            f.write(gzip.compress(expected) + gzip.compress(b"tail" * 1000))
+        expected += b"tail" * 1000
+        size, points = build_seek_points(path, spacing=16 * 1024)
+        self.assertEqual(size, len(expected))
+        # Блоки deflate начинаются с произвольного бита, в том числе нечётного
+        self.assertTrue({point.bits for point in points} & {1, 3, 5, 7})
+        reader = CheckpointedGzipReader(path, seek_index=(size, points))
+        for point in points:
+            reader.seek(point.out_pos)
+            self.assertEqual(reader.read(5000), expected[point.out_pos:point.out_pos + 5000])
+        self.assertEqual(reader.seek(0, os.SEEK_END), len(expected))
+        reader.close()
+
+    def test_new_reader_uses_persisted_seek_points(self):
+        path = os.path.join(self.temp_dir.name, "big.tar.gz")
+        content = "".join(f"record {i * 7919 % 100003}\n" for i in range(120000)).encode()
+        with tarfile.open(path, "w:gz") as tar:
+            for name in ("first.log", "last.log"):
+                tarinfo = tarfile.TarInfo(name=name)
+                tarinfo.size = len(content)
+                tar.addfile(tarinfo, BytesIO(content))
+        archive = TarArchive(path)
+        VirtualFileSystem.open_indexed(archive, path).close()
+        archive.close()
+        self.assertTrue(os.path.exists(seek_index_path(path)))
+        size, points = read_seek_index(path)
+        self.assertGreater(len(points), 2)
+
+        # Новый читатель (как в другом процессе) берёт точки из спутника
+        archive = TarArchive(path)
+        vfs = VirtualFileSystem.open_indexed(archive, path)
+        reader = archive.tar.fileobj
+        self.assertTrue(reader.has_seek_index)
+        with patch.object(reader, "_load_segment", wraps=reader._load_segment) as load:
+            with vfs.open(vfs.lookup("last.log")) as f:
+                self.assertEqual(f.read(), content)
+        # Начало потока не распаковывалось
+        self.assertNotIn(0, [call.args[0] for call in load.call_args_list])
+        vfs.close()
+        archive.close()
+
+    def test_session_reads_gzip_image(self):
+        output = StringIO()
+        session = ShellSession(self.tar_path, sink=StreamSink(output))
+        self.assertIsInstance(session.tar.tar, CompressedTarFile)
+        session.execute("cd logs")
+        session.execute("tac app.log")
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[1], "line 4999")
+        self.assertEqual(lines[-1], "line 0")
+        session.close_filesystem()
+        self.assertTrue(session.tar.tar.fileobj.closed)
+
+    def test_touch_and_exit_rewrite_compressed_image(self):
+        for mode, name in (("w:gz", "vfs.tar.gz"), ("w:xz", "vfs.tar.xz"), ("w:bz2", "vfs.tar.bz2")):
+            path = self.tar_path
+            if mode != "w:gz":
+                path = os.path.join(self.temp_dir.name, name)
+                with tarfile.open(path, mode) as tar:
+                    tar.addfile(tarfile.TarInfo(name="dir0/empty.txt"), BytesIO(b""))
+            output = StringIO()
+            session = ShellSession(path, sink=StreamSink(output))
+            session.execute("touch new.txt")
+            session.execute("exit")
+            self.assertTrue(session.closed, name)
+            self.assertNotIn("Error", output.getvalue())
+            with tarfile.open(path) as tar:
+                self.assertIn("new.txt", tar.getnames())
+                self.assertIn("dir0/empty.txt", tar.getnames())
+            if mode == "w:gz":
+                with tarfile.open(path) as tar:
+                    self.assertEqual(tar.extractfile("logs/app.log").read(), self.content)
+
+    def test_close_reports_sync_failure(self):
+        output = StringIO()
+        session = ShellSession(self.tar_path, sink=StreamSink(output))
+        session.execute("touch new.txt")
+        with patch("session.OverlayFileSystem.sync", side_effect=OSError("disk full")):
+            session.execute("exit")
+        self.assertTrue(session.closed)
+        self.assertIn("Error writing archive: disk full", output.getvalue())
+        self.assertTrue(session.tar.tar.fileobj.closed)
+
+    def test_zstd_image_is_rejected(self):
+        path = os.path.join(self.temp_dir.name, "vfs.tar.zst")
+        with open(path, "wb") as f:
+            f.write(b"\x28\xb5\x2f\xfd" + b"\0" * 100)
+        with self.assertRaisesRegex(tarfile.ReadError, "zstd-compressed images are not supported"):
+            open_archive(path)
+
+class TestOutputBuffer(unittest.TestCase):
+    def test_drain_returns_lines_in_order(self):
+        buffer = OutputBuffer()
+        buffer.write("a")
+        buffer.write("b\nc")
+        self.assertEqual(buffer.drain(), ["a", "b", "c"])
+        self.assertEqual(buffer.drain(), [])
+
+    def test_scrollback_is_capped(self):
+        buffer = OutputBuffer(max_lines=3)
+        for i in range(10):
+            buffer.write(str(i))
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.drain(), ["7", "8", "9"])
+
+class TestReverseLineReader(unittest.TestCase):
+    def reverse(self, data, block_size):
+        lines = list(iter_reverse_lines(BytesIO(data), len(data), block_size=block_size))
+        # Чтение через отображение в память должно давать те же строки
+        with tempfile.TemporaryFile() as f:
+            f.write(b"#" + data + b"#")
+            f.flush()
+            archive_map = ArchiveMap(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            mapped = [bytes(line) for line in archive_map.iter_lines_reversed(1, 1 + len(data))]
+            forward = [bytes(line) for line in archive_map.iter_lines(1, 1 + len(data))]
+            archive_map.close()
+        self.assertEqual(mapped, lines)
+        self.assertEqual(forward, lines[::-1])
+        return lines
+
+    def test_lines_across_block_boundaries(self):
+        data = b"first\nsecond line\r\nthird\n"
+        for block_size in (1, 2, 5, 64):
+            self.assertEqual(self.reverse(data, block_size), [b"third", b"second line", b"first"])
+
+    def test_no_trailing_newline_and_blank_lines(self):
+        self.assertEqual(self.reverse(b"a\n\nb", 2), [b"b", b"", b"a"])
+        self.assertEqual(self.reverse(b"\n", 4), [b""])
+
+    def test_empty_file(self):
+        self.assertEqual(self.reverse(b"", 4), [])
+
+class TestVirtualFileSystem(unittest.TestCase):
+    def setUp(self):
+        self.temp_tar = tempfile.NamedTemporaryFile(delete=False)
+        with tarfile.open(self.temp_tar.name, "w") as tar:
+            tarinfo = tarfile.TarInfo(name="a.txt")
+            tar.addfile(tarinfo, BytesIO(b""))
+            # Каталог без отдельной записи в архиве
+            tarinfo = tarfile.TarInfo(name="./deep/nested/b.txt")
+            tarinfo.size = 3
+            tar.addfile(tarinfo, BytesIO(b"abc"))
+        self.mock_shell = MockShell(self.temp_tar.name)
+
+    def tearDown(self):
+        self.mock_shell.close_filesystem()
+        os.unlink(self.temp_tar.name)
+        if os.path.exists(index_path(self.temp_tar.name)):
+            os.unlink(index_path(self.temp_tar.name))
+
+    def test_implicit_directories(self):
+        vfs = VirtualFileSystem.from_tar(self.mock_shell.tar)
+        self.assertEqual(vfs.listdir("/"), ["a.txt", "deep"])
+        self.assertEqual(vfs.listdir("/deep/nested/"), ["b.txt"])
+        self.assertTrue(vfs.lookup("deep").isdir())
+
+    def test_lookup_file(self):
+        vfs = VirtualFileSystem.from_tar(self.mock_shell.tar)
+        node = vfs.lookup("/deep/nested/b.txt")
+        self.assertTrue(node.isfile())
+        self.assertEqual(node.path, "/deep/nested/b.txt")
+        self.assertIsNone(vfs.lookup("/deep/missing"))
+        self.assertIsNone(vfs.listdir("/a.txt"))
+
+    def test_resolve_memoizes_lookup(self):
+        vfs = VirtualFileSystem.from_tar(self.mock_shell.tar)
+        node = vfs.resolve("/deep/", "nested/../nested/b.txt")
+        self.assertIs(vfs._lookup_cache["deep/nested/b.txt"], node)
+        self.assertIs(vfs.resolve("/", "/deep/nested/b.txt"), node)
+
+    def test_index_rebuilt_after_reload(self):
+        vfs = get_vfs(self.mock_shell)
+        self.assertIs(get_vfs(self.mock_shell), vfs)
+        self.mock_shell.load_filesystem()
+        self.assertIsNot(get_vfs(self.mock_shell), vfs)
+
+    def test_sidecar_index_written_and_reused(self):
+        tar = self.mock_shell.tar
+        VirtualFileSystem.open_indexed(tar, self.temp_tar.name)
+        self.assertTrue(os.path.exists(index_path(self.temp_tar.name)))
+
+        # Индекс читается из спутника, без обращения к заголовкам архива
+        with patch.object(tarfile.TarFile, 'getmembers', side_effect=AssertionError):
+            vfs = VirtualFileSystem.open_indexed(tar, self.temp_tar.name)
+        node = vfs.lookup("deep/nested/b.txt")
+        self.assertEqual(tar.extractfile(node.info).read(), b"abc")
+        self.assertEqual(vfs.listdir("/"), ["a.txt", "deep"])
+
+    def test_sidecar_index_loads_directories_lazily(self):
+        VirtualFileSystem.open_indexed(self.mock_shell.tar, self.temp_tar.name).close()
+        vfs = read_index(self.temp_tar.name, self.mock_shell.tar)
+        # Агрегаты доступны без чтения поддерева
+        self.assertEqual(vfs.usage("/"), (3, 2))
+        deep = vfs.root.children["deep"]
+        self.assertTrue(deep.isdir())
+        self.assertIsNotNone(deep._source)
+        self.assertEqual(vfs.find("b.txt")[0].path, "/deep/nested/b.txt")
+        self.assertEqual([node.path for node in vfs.find("*.txt")], ["/a.txt", "/deep/nested/b.txt"])
+        self.assertIsNone(deep._source)
+        self.assertEqual(vfs.find("missing"), [])
+        vfs.close()
+
+    def test_write_index_leaves_no_temporary_files(self):
+        vfs = VirtualFileSystem.from_tar(self.mock_shell.tar)
+        threads = [threading.Thread(target=write_index, args=(vfs, self.temp_tar.name)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        directory = os.path.dirname(self.temp_tar.name)
+        prefix = os.path.basename(index_path(self.temp_tar.name))
+        self.assertEqual([name for name in os.listdir(directory) if name.startswith(prefix)], [prefix])
+        self.assertEqual(read_index(self.temp_tar.name).listdir("/deep"), ["nested"])
+
+    def test_sidecar_index_invalidated_by_archive_change(self):
+        VirtualFileSystem.open_indexed(self.mock_shell.tar, self.temp_tar.name)
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tar.addfile(tarfile.TarInfo(name="c.txt"), BytesIO(b""))
+        os.utime(self.temp_tar.name, ns=(0, 0))
+        self.assertIsNone(read_index(self.temp_tar.name))
+
+    def test_aggregates_from_sidecar_and_incremental_add(self):
+        with tarfile.open(self.temp_tar.name, "a") as tar:
+            tarinfo = tarfile.TarInfo(name="deep/x/y.txt")
+            tarinfo.size = 5
+            tar.addfile(tarinfo, BytesIO(b"hello"))
+        tar = TarArchive(self.temp_tar.name)
+        VirtualFileSystem.open_indexed(tar, self.temp_tar.name).close()
+        vfs = read_index(self.temp_tar.name, tar)
+        tar.close()
+        self.assertEqual(vfs.usage("/deep"), (8, 2))
+        self.assertEqual(vfs.usage("/"), (8, 3))
+        tarinfo = tarfile.TarInfo(name="deep/x/y.txt")
+        tarinfo.size = 7
+        vfs.add(tarinfo)
+        self.assertEqual(vfs.usage("/deep/x"), (7, 1))
+        self.assertEqual(vfs.usage("/"), (10, 3))
+
+    def test_overlay_journal_replayed(self):
+        journal = self.temp_tar.name + ".journal"
+        base = VirtualFileSystem.from_tar(self.mock_shell.tar)
+        overlay = OverlayFileSystem(base, journal_path=journal)
+        overlay.write_file("deep/new.txt", b"line1\nline2\n")
+
+        restored = OverlayFileSystem(base, journal_path=journal)
+        node = restored.lookup("/deep/new.txt")
+        self.assertEqual(restored.open(node).read(), b"line1\nline2\n")
+        self.assertEqual(restored.listdir("deep"), ["nested", "new.txt"])
+
+        restored.sync()
+        self.assertFalse(os.path.exists(journal))
+        with tarfile.open(self.temp_tar.name, "r") as tar:
+            self.assertEqual(tar.extractfile("deep/new.txt").read(), b"line1\nline2\n")
+
+class TestBenchmark(unittest.TestCase):
+    def test_run_case_on_synthetic_archive(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            archive_path = os.path.join(temp_dir, "deep.tar")
+            benchmark.generate_archive(archive_path, "deep", 200, 0)
+            with tarfile.open(archive_path) as tar:
+                self.assertEqual(len(tar.getmembers()), 201)
+                self.assertEqual(tar.extractfile("logs/big.log").read(80), b"x" * 79 + b"\n")
+            results = benchmark.run_case(archive_path, "deep")
+        for metric in ("cd", "ls", "tac", "touch"):
+            self.assertIn("median_ms", results[metric])
+        self.assertGreater(results["peak_rss_kb"], 0)
+
+    def test_compare_reports_regressions(self):
+        previous = {"cases": [{"shape": "wide", "members": 10, "results": {"ls": {"median_ms": 1.0}}}]}
+        current = {"cases": [{"shape": "wide", "members": 10, "results": {"ls": {"median_ms": 2.0}}}]}
+        self.assertEqual(len(benchmark.compare(current, previous, 1.2)), 1)
+        self.assertEqual(benchmark.compare(previous, current, 1.2), [])
+
 if __name__ == '__main__':
     unittest.main()
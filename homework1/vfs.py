@@ -0,0 +1,980 @@
+import base64
+import json
+import mmap
+import os
+import posixpath
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+from io import BytesIO
+
+READ_BLOCK_SIZE = 64 * 1024
+# Файлы крупнее этого размера не попадают в триграммный индекс и всегда
+# просматриваются целиком
+CONTENT_INDEX_MAX_FILE = 8 * 1024 * 1024
+# Файл с большим числом разных триграммов (обычно двоичный) почти ничего не
+# отсекает, а его списки вхождений дороже чтения; такие файлы не индексируются
+CONTENT_INDEX_MAX_TRIGRAMS = 100000
+GLOB_CHARS = '*?['
+LOOKUP_CACHE_SIZE = 65536
+INDEX_SUFFIX = '.vfsidx'
+JOURNAL_SUFFIX = '.journal'
+INDEX_MAGIC = b'VFSIDX02'
+# magic, размер архива, mtime архива (нс), число записей
+INDEX_HEADER = struct.Struct('<8sQqI')
+# Запись на каждый узел дерева: смещение заголовка, смещение данных, размер,
+# mtime, тип, флаги, длины имени узла, имени члена архива и ссылки, позиция
+# строк, номер родителя, первый ребёнок и число детей, агрегаты поддерева
+INDEX_ENTRY = struct.Struct('<QQQdcBHHHQIIIQQ')
+# Номера записей, отсортированные по имени узла, для find
+INDEX_NAME = struct.Struct('<I')
+INDEX_HAS_INFO = 0x01
+INDEX_IS_DIR = 0x02
+
+
+def normalize_path(path):
+    # Приводит путь внутри архива к виду 'a/b/c' (без ведущих и завершающих '/')
+    path = posixpath.normpath('/' + path.strip('/'))
+    return path.strip('/')
+
+
+def resolve_path(cwd, path):
+    # Абсолютный нормализованный путь: учитывает текущий каталог, '.', '..' и '/'
+    return '/' + normalize_path(posixpath.join(cwd, path))
+
+
+def prefix_range(names, prefix):
+    # Имена из отсортированного списка, начинающиеся с prefix
+    start = bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+        end += 1
+    return names[start:end]
+
+
+class VfsNode:
+    """
+    Узел дерева виртуальной файловой системы.
+    У каталогов есть словарь children, у файлов — ссылка на TarInfo.
+    size и files — суммарный размер и число обычных файлов в поддереве узла.
+    Дети каталога, прочитанного из файла-спутника, создаются при первом
+    обращении к children.
+    """
+    __slots__ = ('name', 'parent', '_children', 'info', 'size', 'files', '_source')
+
+    def __init__(self, name, parent=None, info=None, is_dir=False, source=None):
+        self.name = name
+        self.parent = parent
+        self.info = info
+        self._children = {} if is_dir and source is None else None
+        # (MappedIndex, номер записи) для каталога, дети которого ещё не прочитаны
+        self._source = source
+        self.size = 0
+        self.files = 0
+
+    @property
+    def children(self):
+        if self._source is not None:
+            index, entry = self._source
+            with index.lock:
+                if self._source is not None:
+                    self._children = index.load_children(self, entry)
+                    self._source = None
+        return self._children
+
+    @children.setter
+    def children(self, value):
+        self._source = None
+        self._children = value
+
+    def isdir(self):
+        return self._source is not None or self._children is not None
+
+    def isfile(self):
+        return self.info is not None and self.info.isfile()
+
+    @property
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return '/' + '/'.join(reversed(parts))
+
+
+class VirtualFileSystem:
+    """
+    Индекс содержимого tar-архива в виде дерева каталогов.
+    Строится один раз при загрузке, после чего ls/cd работают за O(детей),
+    а поиск по пути — за O(глубины).
+    """
+
+    def __init__(self, tar=None):
+        self.tar = tar
+        self.root = VfsNode('', is_dir=True)
+        # Имена узлов, добавленных в памяти; узлы из файла-спутника ищутся по mapped_index
+        self.by_name = {}
+        self.mapped_index = None
+        self._content_index = None
+        self._content_index_lock = threading.Lock()
+        # Запомненные результаты lookup: нормализованный путь -> узел
+        self._lookup_cache = {}
+        # Отсортированные имена детей каталога для дополнения: узел -> список
+        self._sorted_children = {}
+        # Пока False, add() не обновляет агрегаты поддеревьев (массовая загрузка)
+        self._track_aggregates = True
+        self.archive_map = None
+
+    @classmethod
+    def from_tar(cls, tar):
+        vfs = cls(tar)
+        vfs.add_all(tar.getmembers())
+        return vfs
+
+    @classmethod
+    def open_indexed(cls, tar, archive_path):
+        """
+        Загружает индекс из файла-спутника рядом с архивом, не читая заголовки tar.
+        Если спутника нет или он устарел, строит индекс по архиву и сохраняет его.
+        Бэкендам без sidecar_index (zip, каталог хоста) спутник не нужен: их
+        оглавление читается быстро.
+        """
+        if not tar.sidecar_index:
+            vfs = cls.from_tar(tar)
+        else:
+            vfs = read_index(archive_path, tar)
+            if vfs is None:
+                vfs = cls.from_tar(tar)
+                try:
+                    write_index(vfs, archive_path)
+                except OSError:
+                    # Каталог архива может быть недоступен для записи — работаем без спутника
+                    pass
+            tar.write_seek_index()
+        if tar.mappable:
+            vfs.archive_map = ArchiveMap.open(archive_path)
+        return vfs
+
+    def close(self):
+        if self.archive_map is not None:
+            self.archive_map.close()
+            self.archive_map = None
+        if self.mapped_index is not None:
+            self.mapped_index.close()
+            self.mapped_index = None
+
+    def iter_entries(self):
+        # Обход узлов, соответствующих записям архива, в порядке добавления
+        stack = [iter(self.root.children.values())]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+            if node.info is not None:
+                yield node
+            if node.children:
+                stack.append(iter(node.children.values()))
+
+    def add_all(self, members):
+        # Агрегаты поддеревьев считаются одним проходом после загрузки всех записей,
+        # а не подъёмом к корню на каждой записи
+        self._track_aggregates = False
+        try:
+            for info in members:
+                self.add(info)
+        finally:
+            self._track_aggregates = True
+            self.compute_aggregates()
+
+    def compute_aggregates(self):
+        order = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            if node.children:
+                stack.extend(node.children.values())
+        for node in reversed(order):
+            if node.children is not None:
+                node.size = sum(child.size for child in node.children.values())
+                node.files = sum(child.files for child in node.children.values())
+            elif node.isfile():
+                node.size, node.files = node.info.size, 1
+            else:
+                node.size, node.files = 0, 0
+
+    def add(self, info):
+        if self._lookup_cache:
+            self._lookup_cache.clear()
+        if self._sorted_children:
+            self._sorted_children.clear()
+        path = normalize_path(info.name)
+        if not path:
+            return self.root
+        parent = self._make_dirs(posixpath.dirname(path))
+        name = posixpath.basename(path)
+        node = parent.children.get(name)
+        if node is None:
+            node = VfsNode(name, parent, info, is_dir=info.isdir())
+            parent.children[name] = node
+            self.by_name.setdefault(name, []).append(node)
+            old_size = old_files = 0
+        else:
+            # Повторная запись с тем же именем перекрывает предыдущую, как в tarfile
+            old_size, old_files = node.size, node.files
+            node.info = info
+            if info.isdir() and node.children is None:
+                node.children = {}
+                node.size = node.files = 0
+            elif not info.isdir():
+                node.children = None
+        if not node.isdir():
+            node.size, node.files = (info.size, 1) if info.isfile() else (0, 0)
+        if self._track_aggregates:
+            self._propagate(parent, node.size - old_size, node.files - old_files)
+        return node
+
+    def _propagate(self, node, size, files):
+        # Изменение агрегатов поднимается от каталога к корню: O(глубины)
+        if not size and not files:
+            return
+        while node is not None:
+            node.size += size
+            node.files += files
+            node = node.parent
+
+    def _make_dirs(self, path):
+        node = self.root
+        if not path:
+            return node
+        for part in path.split('/'):
+            child = node.children.get(part) if node.children is not None else None
+            if child is None:
+                # Каталог, для которого в архиве нет отдельной записи
+                child = VfsNode(part, node, is_dir=True)
+                node.children[part] = child
+                self.by_name.setdefault(part, []).append(child)
+            elif child.children is None:
+                child.children = {}
+                if self._track_aggregates:
+                    self._propagate(node, -child.size, -child.files)
+                child.size = child.files = 0
+            node = child
+        return node
+
+    def lookup(self, path):
+        path = normalize_path(path)
+        node = self._lookup_cache.get(path)
+        if node is not None:
+            return node
+        node = self.root
+        if path:
+            for part in path.split('/'):
+                if node.children is None:
+                    return None
+                node = node.children.get(part)
+                if node is None:
+                    return None
+        if len(self._lookup_cache) >= LOOKUP_CACHE_SIZE:
+            self._lookup_cache.clear()
+        self._lookup_cache[path] = node
+        return node
+
+    def resolve(self, cwd, path):
+        return self.lookup(resolve_path(cwd, path))
+
+    def listdir(self, path):
+        node = self.lookup(path)
+        if node is None or not node.isdir():
+            return None
+        return list(node.children)
+
+    def complete(self, path, prefix):
+        """
+        Имена детей каталога path, начинающиеся с prefix, по возрастанию.
+        Список детей сортируется один раз, дальше поиск идёт делением пополам.
+        """
+        node = self.lookup(path)
+        if node is None or not node.isdir():
+            return []
+        names = self._sorted_children.get(node)
+        if names is None:
+            names = sorted(node.children)
+            self._sorted_children[node] = names
+        return prefix_range(names, prefix)
+
+    def usage(self, path):
+        # (размер, число файлов) поддерева или None, если пути нет
+        node = self.lookup(path)
+        if node is None:
+            return None
+        return node.size, node.files
+
+    def find_by_name(self, name):
+        nodes = self.by_name.get(name, [])
+        if self.mapped_index is None:
+            return nodes
+        return [self._mapped_node(entry) for entry in self.mapped_index.find(name)] + nodes
+
+    def find(self, pattern):
+        # Точное имя ищется по индексу имён, шаблон — перебором различных имён
+        if not any(char in pattern for char in GLOB_CHARS):
+            return list(self.find_by_name(pattern))
+        nodes = []
+        if self.mapped_index is not None:
+            nodes = [self._mapped_node(entry) for entry in self.mapped_index.match(pattern)]
+        return nodes + [node for name, named in self.by_name.items()
+                        if fnmatchcase(name, pattern) for node in named]
+
+    def _mapped_node(self, entry):
+        # Узел записи спутника: каталоги на пути к нему читаются по мере спуска
+        return self.lookup(self.mapped_index.path(entry))
+
+    def iter_files(self, path='/'):
+        node = self.lookup(path)
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.isdir():
+                stack.extend(reversed(list(node.children.values())))
+            elif node.isfile():
+                yield node
+
+    def content_index(self, path='/', opener=None):
+        """
+        Триграммный индекс содержимого файлов. Дополняется лениво: при первом
+        обращении к каталогу индексируются только файлы его поддерева, дальше
+        индекс переиспользуется всеми запросами к этому поддереву.
+        """
+        with self._content_index_lock:
+            if self._content_index is None:
+                self._content_index = ContentIndex()
+            index = self._content_index
+            node = self.lookup(path)
+            if node is not None and not index.covers_subtree(node):
+                opener = opener or self.open
+                for file_node in self.iter_files(path):
+                    if file_node.info.size <= CONTENT_INDEX_MAX_FILE and not index.covers(file_node):
+                        with opener(file_node) as fileobj:
+                            index.add(file_node, fileobj)
+                index.subtrees.add(node)
+            return index
+
+    def open(self, node):
+        return self.tar.extractfile(node.info)
+
+
+class MappedIndex:
+    """
+    Оглавление архива из файла-спутника, отображённое в память. При загрузке
+    записи не разбираются: дети каталога лежат в спутнике подряд и превращаются
+    в узлы при первом обращении к каталогу, поэтому запуск с готовым
+    спутником не зависит от числа записей.
+    """
+
+    def __init__(self, mm, count):
+        self.mm = mm
+        self.count = count
+        self.lock = threading.Lock()
+        self.names_pos = INDEX_HEADER.size + count * INDEX_ENTRY.size
+        self.strings_pos = self.names_pos + (count - 1) * INDEX_NAME.size
+
+    def close(self):
+        self.mm.close()
+
+    def entry(self, index):
+        return INDEX_ENTRY.unpack_from(self.mm, INDEX_HEADER.size + index * INDEX_ENTRY.size)
+
+    def _decode(self, start, length):
+        return self.mm[start:start + length].decode('utf-8', 'surrogateescape')
+
+    def node_name(self, index):
+        entry = self.entry(index)
+        return self._decode(self.strings_pos + entry[9], entry[6])
+
+    def make_node(self, index, parent):
+        (offset, offset_data, size, mtime, member_type, flags, name_len, member_len, link_len,
+         strings, _, _, _, total_size, files) = self.entry(index)
+        start = self.strings_pos + strings
+        info = None
+        if flags & INDEX_HAS_INFO:
+            info = tarfile.TarInfo(self._decode(start + name_len, member_len))
+            info.offset = offset
+            info.offset_data = offset_data
+            info.size = size
+            info.mtime = mtime
+            info.type = member_type
+            info.linkname = self._decode(start + name_len + member_len, link_len)
+        source = (self, index) if flags & INDEX_IS_DIR else None
+        node = VfsNode(self._decode(start, name_len), parent, info, source=source)
+        node.size, node.files = total_size, files
+        return node
+
+    def load_children(self, node, index):
+        first, count = self.entry(index)[11:13]
+        children = {}
+        for child_index in range(first, first + count):
+            child = self.make_node(child_index, node)
+            children[child.name] = child
+        return children
+
+    def path(self, index):
+        parts = []
+        while index:
+            parts.append(self.node_name(index))
+            index = self.entry(index)[10]
+        return '/'.join(reversed(parts))
+
+    def _sorted_entry(self, rank):
+        return INDEX_NAME.unpack_from(self.mm, self.names_pos + rank * INDEX_NAME.size)[0]
+
+    def find(self, name):
+        # Записи с именем name: двоичный поиск по таблице, отсортированной по именам
+        ranks = range(self.count - 1)
+        rank = bisect_left(ranks, name, key=lambda rank: self.node_name(self._sorted_entry(rank)))
+        entries = []
+        while rank < len(ranks):
+            entry = self._sorted_entry(rank)
+            if self.node_name(entry) != name:
+                break
+            entries.append(entry)
+            rank += 1
+        return entries
+
+    def match(self, pattern):
+        # Записи, имена которых подходят под шаблон; каждое имя проверяется один раз
+        entries = []
+        previous = matched = None
+        for rank in range(self.count - 1):
+            entry = self._sorted_entry(rank)
+            name = self.node_name(entry)
+            if name != previous:
+                previous, matched = name, fnmatchcase(name, pattern)
+            if matched:
+                entries.append(entry)
+        return entries
+
+
+class ArchiveMap:
+    """
+    Несжатый tar-архив, отображённый в память. Данные члена архива отдаются
+    срезами memoryview по смещению его данных, без копирования; одно отображение
+    может разделяться всеми сеансами, работающими с архивом.
+    """
+
+    def __init__(self, mm):
+        self.mm = mm
+        self.view = memoryview(mm)
+
+    @classmethod
+    def open(cls, archive_path):
+        try:
+            with open(archive_path, 'rb') as f:
+                return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+
+    def member_range(self, info):
+        start = info.offset_data
+        end = start + info.size
+        # Записи, дописанные в архив после отображения, в него не попадают;
+        # отрицательное смещение — член хранится сжатым (zip)
+        if not info.isfile() or start < 0 or end > len(self.mm):
+            return None
+        return start, end
+
+    def member_view(self, info):
+        bounds = self.member_range(info)
+        if bounds is None:
+            return None
+        return self.view[bounds[0]:bounds[1]]
+
+    def iter_lines(self, start, end):
+        pos = start
+        while pos < end:
+            newline = self.mm.find(b'\n', pos, end)
+            stop = end if newline < 0 else newline
+            yield self._line(pos, stop)
+            pos = stop + 1
+
+    def iter_lines_reversed(self, start, end):
+        if start == end:
+            return
+        stop = end - 1 if self.mm[end - 1] == ord('\n') else end
+        while True:
+            newline = self.mm.rfind(b'\n', start, stop)
+            line_start = start if newline < 0 else newline + 1
+            yield self._line(line_start, stop)
+            if newline < 0:
+                break
+            stop = newline
+
+    def _line(self, start, stop):
+        if stop > start and self.mm[stop - 1] == ord('\r'):
+            stop -= 1
+        return self.view[start:stop]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # Срезы ещё используются; отображение закроется вместе с ними
+            pass
+
+
+def trigrams(data):
+    # Триграммы как кортежи из трёх байтов: zip по сдвинутым срезам перебирает
+    # позиции в C, а не в цикле Python
+    return set(zip(data, data[1:], data[2:]))
+
+
+class ContentIndex:
+    # Отображение триграмма (3 байта) -> множество узлов файлов, где он встречается
+    def __init__(self):
+        self.postings = {}
+        self.indexed = set()
+        # Каталоги, все файлы поддерева которых уже проиндексированы
+        self.subtrees = set()
+
+    def add(self, node, fileobj):
+        found = set()
+        overlap = b''
+        while True:
+            block = fileobj.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            data = overlap + block
+            found |= trigrams(data)
+            if len(found) > CONTENT_INDEX_MAX_TRIGRAMS:
+                # Не попадает в indexed, поэтому grep проверяет его напрямую
+                return
+            overlap = data[-2:]
+        for trigram in found:
+            self.postings.setdefault(trigram, set()).add(node)
+        self.indexed.add(node)
+
+    def candidates(self, literal):
+        """
+        Множество проиндексированных файлов, которые могут содержать literal,
+        или None, если строка короче триграмма и отсечь ничего нельзя.
+        """
+        if len(literal) < 3:
+            return None
+        postings = sorted((self.postings.get(t, set()) for t in trigrams(literal)), key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result &= posting
+        return result
+
+    def covers(self, node):
+        return node in self.indexed
+
+    def covers_subtree(self, node):
+        while node is not None:
+            if node in self.subtrees:
+                return True
+            node = node.parent
+        return False
+
+
+class OverlayFileSystem:
+    """
+    Слой копирования при записи поверх индекса архива, доступного только для чтения.
+    Созданные и изменённые файлы хранятся в памяти (и, при необходимости, в журнале
+    рядом с архивом) и попадают в сам архив только при вызове sync().
+    """
+
+    def __init__(self, base, tar=None, journal_path=None, pending=None, counter=None):
+        self.base = base
+        self.tar = tar if tar is not None else base.tar
+        self.journal_path = journal_path
+        self.counter = counter if counter is not None else ReadCounter()
+        self.upper = VirtualFileSystem()
+        self.pending = {}
+        # Пути из pending, которых не было в базовом индексе при записи
+        self._created = set()
+        for path, (info, data) in (pending or {}).items():
+            self._record(path, info, data)
+        if journal_path and not pending:
+            self._replay_journal()
+
+    @property
+    def dirty(self):
+        return bool(self.pending)
+
+    def rebase(self, base, tar):
+        # Переход на перестроенный базовый индекс; несохранённые изменения остаются в слое
+        self.base = base
+        self.tar = tar
+
+    def conflicts(self):
+        # Файлы, созданные в слое, которые тем временем появились в архиве (записаны другим сеансом)
+        return [path for path in self.pending
+                if path in self._created and self.base.lookup(path) is not None]
+
+    def lookup(self, path):
+        node = self.upper.lookup(path)
+        if node is not None and not node.isdir():
+            return node
+        base_node = self.base.lookup(path)
+        return base_node if base_node is not None else node
+
+    def resolve(self, cwd, path):
+        return self.lookup(resolve_path(cwd, path))
+
+    def listdir(self, path):
+        base_names = self.base.listdir(path)
+        upper_names = self.upper.listdir(path)
+        if upper_names is None:
+            return base_names
+        if base_names is None:
+            return upper_names
+        seen = set(base_names)
+        return base_names + [name for name in upper_names if name not in seen]
+
+    def complete(self, path, prefix):
+        base_names = self.base.complete(path, prefix)
+        upper_names = self.upper.complete(path, prefix)
+        if not upper_names:
+            return base_names
+        return sorted(set(base_names).union(upper_names))
+
+    def usage(self, path):
+        """
+        Агрегаты поддерева с учётом слоя: сумма агрегатов базового индекса и слоя
+        за вычетом файлов базы, перекрытых файлами слоя. Перебираются только
+        изменённые пути, поэтому после touch ничего не пересчитывается.
+        """
+        upper = self.upper.usage(path)
+        if upper is not None and not self.upper.lookup(path).isdir():
+            return upper
+        base = self.base.usage(path)
+        if base is None:
+            return upper
+        if upper is None:
+            return base
+        size, files = base[0] + upper[0], base[1] + upper[1]
+        prefix = normalize_path(path)
+        for pending_path in self.pending:
+            if prefix and not pending_path.startswith(prefix + '/'):
+                continue
+            shadowed = self.base.lookup(pending_path)
+            if shadowed is not None and shadowed.isfile():
+                size -= shadowed.size
+                files -= 1
+        return size, files
+
+    def find_by_name(self, name):
+        nodes = [node for node in self.base.find_by_name(name)
+                 if normalize_path(node.path) not in self.pending]
+        return nodes + [node for node in self.upper.find_by_name(name) if not node.isdir()]
+
+    def find(self, pattern):
+        nodes = [node for node in self.base.find(pattern)
+                 if normalize_path(node.path) not in self.pending]
+        return nodes + [node for node in self.upper.find(pattern) if not node.isdir()]
+
+    def iter_files(self, path='/'):
+        for node in self.base.iter_files(path):
+            if normalize_path(node.path) not in self.pending:
+                yield node
+        yield from self.upper.iter_files(path)
+
+    def content_index(self, path='/'):
+        # Индекс общий для всех слоёв над одним базовым индексом; файлы слоя
+        # в него не входят и проверяются напрямую
+        return self.base.content_index(path, self.open)
+
+    def open(self, node):
+        entry = self.pending.get(normalize_path(node.path))
+        if entry is not None and entry[0] is node.info:
+            return BytesIO(entry[1])
+        return CountingReader(self.tar.extractfile(node.info), self.counter)
+
+    def iter_lines(self, node):
+        """
+        Строки файла (без перевода строки) по порядку. Для несжатого архива это
+        срезы memoryview отображения, иначе строки bytes из потока члена архива.
+        """
+        bounds = self._mapped_range(node)
+        if bounds is not None:
+            for line in self.base.archive_map.iter_lines(*bounds):
+                self.counter.bytes += len(line) + 1
+                yield line
+            return
+        with self.open(node) as fileobj:
+            for line in fileobj:
+                yield line.rstrip(b'\r\n')
+
+    def iter_lines_reversed(self, node):
+        bounds = self._mapped_range(node)
+        if bounds is not None:
+            for line in self.base.archive_map.iter_lines_reversed(*bounds):
+                self.counter.bytes += len(line) + 1
+                yield line
+            return
+        with self.open(node) as fileobj:
+            if self.tar.seeks_backward_cheaply or normalize_path(node.path) in self.pending:
+                yield from iter_reverse_lines(fileobj, node.info.size)
+                return
+            # Один проход вперёд во временный файл вместо распаковки с начала
+            # на каждом шаге назад
+            with tempfile.TemporaryFile() as spool:
+                shutil.copyfileobj(fileobj, spool, READ_BLOCK_SIZE)
+                yield from iter_reverse_lines(spool, node.info.size)
+
+    def read_view(self, node):
+        # Всё содержимое файла как memoryview, если архив отображён в память
+        if self._mapped_range(node) is None:
+            return None
+        view = self.base.archive_map.member_view(node.info)
+        self.counter.bytes += len(view)
+        return view
+
+    def _mapped_range(self, node):
+        archive_map = self.base.archive_map
+        if archive_map is None or normalize_path(node.path) in self.pending:
+            return None
+        return archive_map.member_range(node.info)
+
+    def write_file(self, path, data=b'', mtime=None):
+        path = normalize_path(path)
+        info = tarfile.TarInfo(name=path)
+        info.size = len(data)
+        info.mtime = time.time() if mtime is None else mtime
+        self._record(path, info, data)
+        if self.journal_path:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(json.dumps({
+                    'path': path,
+                    'mtime': info.mtime,
+                    'data': base64.b64encode(data).decode('ascii'),
+                }) + '\n')
+        return self.upper.lookup(path)
+
+    def sync(self):
+        """
+        Дописывает накопленные изменения в архив и очищает слой. Файлы из
+        conflicts() не записываются, чтобы в архиве не появилось двух записей
+        с одним именем. Возвращает число записанных файлов.
+        """
+        conflicts = set(self.conflicts())
+        entries = [entry for path, entry in self.pending.items() if path not in conflicts]
+        if entries:
+            self.tar.append(entries)
+        self.pending = {}
+        self._created = set()
+        self.upper = VirtualFileSystem()
+        if self.journal_path and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        return len(entries)
+
+    def _record(self, path, info, data):
+        if path not in self.pending and self.base.lookup(path) is None:
+            self._created.add(path)
+        self.pending.pop(path, None)
+        self.pending[path] = (info, data)
+        self.upper.add(info)
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as journal:
+            for line in journal:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                info = tarfile.TarInfo(name=record['path'])
+                data = base64.b64decode(record['data'])
+                info.size = len(data)
+                info.mtime = record['mtime']
+                self._record(record['path'], info, data)
+
+
+class ReadCounter:
+    # Сколько байт данных прочитано из архива
+    def __init__(self):
+        self.bytes = 0
+
+
+class CountingReader:
+    # Обёртка над файлом члена архива, учитывающая прочитанные байты в ReadCounter
+    def __init__(self, fileobj, counter):
+        self.fileobj = fileobj
+        self.counter = counter
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.counter.bytes += len(data)
+        return data
+
+    def readline(self, size=-1):
+        line = self.fileobj.readline(size)
+        self.counter.bytes += len(line)
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+
+def iter_reverse_lines(fileobj, size, block_size=READ_BLOCK_SIZE):
+    """
+    Возвращает строки файла (bytes, без перевода строки) в обратном порядке.
+    Файл читается блоками с конца, поэтому в памяти держится не больше одного
+    блока и незавершённой строки.
+    """
+    pos = size
+    tail = b''
+    last = True
+    while pos > 0:
+        read_size = min(block_size, pos)
+        pos -= read_size
+        fileobj.seek(pos)
+        lines = (fileobj.read(read_size) + tail).split(b'\n')
+        tail = lines[0]
+        rest = lines[1:]
+        if last:
+            # Завершающий перевод строки не порождает пустую строку
+            if rest and rest[-1] == b'':
+                rest.pop()
+            last = False
+        for line in reversed(rest):
+            yield line.rstrip(b'\r')
+    if size:
+        yield tail.rstrip(b'\r')
+
+
+def index_path(archive_path):
+    return archive_path + INDEX_SUFFIX
+
+
+def journal_path(archive_path):
+    return archive_path + JOURNAL_SUFFIX
+
+
+def archive_stamp(archive_path):
+    st = os.stat(archive_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def write_index(vfs, archive_path):
+    """
+    Сохраняет дерево в файл-спутник. Узлы пишутся в порядке обхода в ширину,
+    так что дети каждого каталога занимают непрерывный диапазон записей; за
+    записями идут номера, отсортированные по именам узлов, и строки.
+    """
+    size, mtime_ns = archive_stamp(archive_path)
+    path = index_path(archive_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, size, mtime_ns, 0))
+            nodes = [vfs.root]
+            parents = [0]
+            strings = bytearray()
+            index = 0
+            while index < len(nodes):
+                node = nodes[index]
+                first_child = len(nodes)
+                if node.isdir():
+                    for child in node.children.values():
+                        nodes.append(child)
+                        parents.append(index)
+                info = node.info
+                name = node.name.encode('utf-8', 'surrogateescape')
+                member = linkname = b''
+                flags = INDEX_IS_DIR if node.isdir() else 0
+                if info is not None:
+                    flags |= INDEX_HAS_INFO
+                    member = info.name.encode('utf-8', 'surrogateescape')
+                    linkname = info.linkname.encode('utf-8', 'surrogateescape')
+                f.write(INDEX_ENTRY.pack(
+                    info.offset if info is not None else 0,
+                    info.offset_data if info is not None else 0,
+                    info.size if info is not None else 0,
+                    float(info.mtime) if info is not None else 0.0,
+                    info.type if info is not None else tarfile.DIRTYPE,
+                    flags, len(name), len(member), len(linkname), len(strings),
+                    parents[index], first_child, len(nodes) - first_child, node.size, node.files
+                ))
+                strings += name + member + linkname
+                index += 1
+            for index in sorted(range(1, len(nodes)), key=lambda index: nodes[index].name):
+                f.write(INDEX_NAME.pack(index))
+            f.write(strings)
+            # Число записей известно только после обхода
+            f.seek(0)
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, size, mtime_ns, len(nodes)))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_index(archive_path, tar=None):
+    """
+    Индекс из файла-спутника. Отображение спутника остаётся открытым, узлы
+    создаются по мере обращения к каталогам. Возвращает None, если спутник
+    отсутствует, повреждён или не соответствует архиву.
+    """
+    path = index_path(archive_path)
+    try:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(mm, 0)
+        if (magic != INDEX_MAGIC or (size, mtime_ns) != archive_stamp(archive_path) or count < 1
+                or len(mm) < INDEX_HEADER.size + count * INDEX_ENTRY.size + (count - 1) * INDEX_NAME.size):
+            mm.close()
+            return None
+        index = MappedIndex(mm, count)
+        vfs = VirtualFileSystem(tar)
+        vfs.mapped_index = index
+        vfs.root = index.make_node(0, None)
+        return vfs
+    except (OSError, struct.error):
+        mm.close()
+        return None
+
+
+def get_vfs(shell):
+    # Возвращает индекс оболочки, перестраивая его, если архив был переоткрыт
+    # Несохранённые изменения слоя переносятся в новый индекс
+    vfs = getattr(shell, 'vfs', None)
+    if vfs is None or vfs.tar is not shell.tar:
+        pending = vfs.pending if vfs is not None else None
+        counter = vfs.counter if vfs is not None else None
+        vfs = OverlayFileSystem(VirtualFileSystem.from_tar(shell.tar), shell.tar,
+                                pending=pending, counter=counter)
+        shell.vfs = vfs
+    return vfs
@@ -0,0 +1,148 @@
+import posixpath
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Порядок суффиксов версий apk: до релиза (_alpha.._rc), релиз, после (_cvs.._p)
+SUFFIX_ORDER = {'alpha': -4, 'beta': -3, 'pre': -2, 'rc': -1, 'cvs': 1, 'svn': 2, 'git': 3, 'hg': 4, 'p': 5}
+VERSION_RE = re.compile(r'^(\d+(?:\.\d+)*)([a-z]?)((?:_[a-z]+\d*)*)(?:-r(\d+))?$')
+SUFFIX_RE = re.compile(r'_([a-z]+)(\d*)')
+DEPENDENCY_RE = re.compile(r'^(!?)([^<>=~]+)(?:(<=|>=|<|>|=|~)(.+))?$')
+
+
+class Package(NamedTuple):
+    # Запись APKINDEX: P, V, D, p, S, I, k
+    name: str
+    version: str
+    depends: Tuple[str, ...]
+    provides: Tuple[str, ...]
+    size: int
+    installed_size: int
+    provider_priority: int
+
+    @classmethod
+    def from_stanza(cls, stanza: Dict[str, str]) -> 'Package':
+        return cls(
+            name=stanza['P'],
+            version=stanza.get('V', ''),
+            depends=tuple(stanza.get('D', '').split()),
+            provides=tuple(stanza.get('p', '').split()),
+            size=int(stanza.get('S') or 0),
+            installed_size=int(stanza.get('I') or 0),
+            provider_priority=int(stanza.get('k') or 0),
+        )
+
+
+class Dependency(NamedTuple):
+    name: str
+    op: Optional[str]
+    version: Optional[str]
+    conflict: bool
+
+
+def parse_dependency(token: str) -> Dependency:
+    # 'so:libc.so.1', 'busybox>=1.36', '!openssl-dev' -> имя, условие на версию, признак конфликта
+    match = DEPENDENCY_RE.match(token)
+    if match is None:
+        return Dependency(token, None, None, False)
+    conflict, name, op, version = match.groups()
+    return Dependency(name, op, version, bool(conflict))
+
+
+def version_key(version: str):
+    """
+    Ключ сравнения версий apk: числовые компоненты, буква, суффиксы (_rc1 < релиз < _p1)
+    и номер сборки -rN. Нестандартные версии сравниваются как строки и считаются
+    меньше стандартных.
+    """
+    match = VERSION_RE.match(version)
+    if match is None:
+        return (), version
+    numbers, letter, suffixes, release = match.groups()
+    suffix_key = tuple((SUFFIX_ORDER.get(name, 0), int(number or 0))
+                       for name, number in SUFFIX_RE.findall(suffixes))
+    return tuple(int(part) for part in numbers.split('.')), letter, suffix_key + ((0, 0),), int(release or 0)
+
+
+def satisfies(version: str, op: str, required: str) -> bool:
+    if op == '~':
+        # Нечёткое совпадение: версия начинается с указанных компонентов
+        return version == required or version.startswith(required + '.') or version.startswith(required + '-')
+    have, want = version_key(version), version_key(required)
+    if op == '=':
+        return have == want
+    if op == '<':
+        return have < want
+    if op == '>':
+        return have > want
+    if op == '<=':
+        return have <= want
+    return have >= want
+
+
+class ProvidesIndex:
+    """
+    Обратный индекс: предоставляемое имя (имя пакета, so:, cmd:, pc: и т.п.) ->
+    список (версия, пакет). Разрешение зависимости — поиск по словарю и отбор
+    среди нескольких поставщиков, без перебора всех пакетов.
+    """
+
+    def __init__(self, packages: Iterable[Package]):
+        self.providers: Dict[str, List[Tuple[Optional[str], Package]]] = {}
+        for package in packages:
+            self.providers.setdefault(package.name, []).append((package.version, package))
+            for token in package.provides:
+                name, _, version = token.partition('=')
+                self.providers.setdefault(name, []).append((version or None, package))
+
+    def resolve(self, dependency: Dependency) -> Optional[str]:
+        """
+        Имя пакета, удовлетворяющего зависимости, или None. Пакет с тем же именем
+        предпочтительнее виртуальных поставщиков; среди поставщиков выбирается
+        больший provider_priority, затем большая версия, затем меньшее имя.
+        """
+        candidates = self.providers.get(dependency.name)
+        if candidates is None and dependency.name.startswith('/'):
+            # Зависимость от пути (например, /bin/sh) в индексе описана как cmd:
+            candidates = self.providers.get('cmd:' + posixpath.basename(dependency.name))
+        if not candidates:
+            return None
+        if dependency.op is not None:
+            candidates = [(version, package) for version, package in candidates
+                          if version is not None and satisfies(version, dependency.op, dependency.version)]
+        best = None
+        for version, package in sorted(candidates, key=lambda candidate: candidate[1].name):
+            if package.name == dependency.name:
+                return package.name
+            key = (package.provider_priority, version_key(version or ''))
+            if best is None or key > best[0]:
+                best = key, package.name
+        return best[1] if best is not None else None
+
+
+def build_packages(stanzas: Iterable[Dict[str, str]]) -> Dict[str, Package]:
+    # Записи APKINDEX без P: пропускаются; повторное имя заменяет предыдущее
+    return {stanza['P']: Package.from_stanza(stanza) for stanza in stanzas if stanza.get('P')}
+
+
+def resolve_dependencies(packages: Dict[str, Package]) -> Dict[str, List[str]]:
+    """
+    Словарь пакет -> пакеты, от которых он зависит. Виртуальные зависимости
+    (so:, cmd:, pc:, условия на версию) заменяются пакетами-поставщиками,
+    конфликты (!имя) отбрасываются. Неразрешённая зависимость остаётся под
+    своим именем, чтобы быть видной в графе.
+    """
+    index = ProvidesIndex(packages.values())
+    packages_db = {}
+    for package in packages.values():
+        deps = []
+        for token in package.depends:
+            dependency = parse_dependency(token)
+            if dependency.conflict:
+                continue
+            target = index.resolve(dependency)
+            if target is None:
+                target = dependency.name
+            if target != package.name:
+                deps.append(target)
+        packages_db[package.name] = list(dict.fromkeys(deps))
+    return packages_db
@@ -1,13 +1,37 @@
 import os
 import sys
+import argparse
+import gzip
+import hashlib
+import io
+import json
 import subprocess
 import tempfile
 import tarfile
+import time
+import threading
+import zlib
 import requests
-from typing import Dict, List, Set
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional
 import xml.etree.ElementTree as ET
 import shutil
 
+from apkindex import Package, build_packages, resolve_dependencies
+from package_graph import PackageGraph, index_checksum, load_snapshot, write_snapshot
+
+# URLs репозиториев Alpine Linux и архитектуры, для которых скачивается APKINDEX
+REPOSITORIES = [
+    "https://dl-cdn.alpinelinux.org/alpine/latest-stable/main",
+    "https://dl-cdn.alpinelinux.org/alpine/latest-stable/community"
+]
+ARCHITECTURES = ["x86_64"]
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "apk-dependency-visualizer")
+# Копия в кэше моложе этого возраста (в секундах) используется без обращения к сети
+CACHE_MAX_AGE = 3600
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_TIMEOUT = 60
+
 
 def download_apkindex(repo_url: str, temp_dir: str) -> str:
     """
@@ -26,6 +50,16 @@ def download_apkindex(repo_url: str, temp_dir: str) -> str:
             f.write(chunk)
     print(f"Скачивание завершено: {tar_path}")
 
+    apkindex_path = extract_apkindex(tar_path, temp_dir, f'APKINDEX-{repo_name}')
+    os.remove(tar_path)
+    return apkindex_path
+
+
+def extract_apkindex(tar_path: str, temp_dir: str, name: str) -> str:
+    """
+    Извлекает файл APKINDEX из архива tar_path в temp_dir под именем name.
+    Сам архив не удаляется: он может принадлежать кэшу.
+    """
     # Извлекаем APKINDEX из архива с использованием фильтра для безопасности
     try:
         with tarfile.open(tar_path, 'r:gz') as tar:
@@ -36,13 +70,12 @@ def download_apkindex(repo_url: str, temp_dir: str) -> str:
                 return tarinfo
 
             tar.extractall(path=temp_dir, members=(m for m in tar if is_safe(m)))
-        os.remove(tar_path)
     except tarfile.TarError as e:
         raise RuntimeError(f"Ошибка при распаковке {tar_path}: {e}")
 
     # Найти извлеченный APKINDEX и переименовать его
     extracted_apkindex = os.path.join(temp_dir, 'APKINDEX')
-    renamed_apkindex = os.path.join(temp_dir, f'APKINDEX-{repo_name}')
+    renamed_apkindex = os.path.join(temp_dir, name)
     if os.path.exists(extracted_apkindex):
         os.rename(extracted_apkindex, renamed_apkindex)
         return renamed_apkindex
@@ -50,6 +83,219 @@ def download_apkindex(repo_url: str, temp_dir: str) -> str:
         raise FileNotFoundError(f"Файл APKINDEX не найден в {tar_path}")
 
 
+def apkindex_url(repo_url: str, arch: str = "x86_64") -> str:
+    return f"{repo_url.rstrip('/')}/{arch}/APKINDEX.tar.gz"
+
+
+def cache_paths(url: str, cache_dir: str = CACHE_DIR):
+    # Пути копии файла и её метаданных (ETag, Last-Modified) в кэше
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(cache_dir, f"{key}.tar.gz"), os.path.join(cache_dir, f"{key}.json")
+
+
+def write_cache_meta(meta_path: str, meta: dict) -> None:
+    tmp_meta = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta, meta_path)
+
+
+class CachingReader(io.RawIOBase):
+    """
+    Тело HTTP-ответа как поток для чтения. Прочитанные данные одновременно
+    пишутся во временный файл кэша. commit() дочитывает ответ до конца, и файл
+    вместе с метаданными атомарно заменяет прежнюю копию; закрытие без commit()
+    (например, после ошибки разбора) отбрасывает скачанное.
+    """
+
+    def __init__(self, response, data_path: str, meta_path: str, meta: dict):
+        super().__init__()
+        self.response = response
+        self.data_path = data_path
+        self.meta_path = meta_path
+        self.meta = meta
+        self.tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._file = open(self.tmp_path, 'wb')
+        self._chunks = response.iter_content(chunk_size=65536)
+        self._pending = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._file.write(chunk)
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def commit(self):
+        for chunk in self._chunks:
+            self._file.write(chunk)
+        self._file.close()
+        os.replace(self.tmp_path, self.data_path)
+        self.meta['checked'] = time.time()
+        write_cache_meta(self.meta_path, self.meta)
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.response.close()
+        super().close()
+
+
+def open_apkindex(url: str, cache_dir: str = CACHE_DIR, max_age: float = CACHE_MAX_AGE):
+    """
+    Открывает APKINDEX.tar.gz для последовательного чтения через постоянный кэш.
+    Свежая копия читается из кэша без обращения к сети; устаревшая проверяется
+    условным запросом (If-None-Match / If-Modified-Since), и при ответе 304
+    читается копия. Иначе возвращается CachingReader над телом ответа, который
+    сохраняет файл в кэш по мере чтения. Если сеть недоступна, используется
+    имеющаяся копия.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path = cache_paths(url, cache_dir)
+
+    meta = {}
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+    if meta and time.time() - meta.get('checked', 0) < max_age:
+        return open(data_path, 'rb')
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    except requests.RequestException as e:
+        if not meta:
+            raise ConnectionError(f"Не удалось скачать APKINDEX из {url}: {e}")
+        print(f"Сеть недоступна, используется копия из кэша: {url}")
+        return open(data_path, 'rb')
+
+    if response.status_code == 304 and meta:
+        response.close()
+        print(f"APKINDEX не изменился: {url}")
+        meta['checked'] = time.time()
+        write_cache_meta(meta_path, meta)
+        return open(data_path, 'rb')
+    if response.status_code != 200:
+        response.close()
+        raise ConnectionError(f"Не удалось скачать APKINDEX из {url}")
+    return CachingReader(response, data_path, meta_path, {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    })
+
+
+def load_apkindex(url: str, cache_dir: str = CACHE_DIR, max_age: float = CACHE_MAX_AGE,
+                  parse_cached: bool = False) -> Optional[Dict[str, Package]]:
+    """
+    Получает APKINDEX через кэш. Если файл скачивается, пакеты разбираются прямо
+    из потока ответа, пока загрузка ещё идёт. Неизменившуюся копию из кэша
+    разбирать может быть не нужно (подойдёт снимок базы), поэтому она
+    разбирается только с parse_cached, иначе возвращается None. Ответ, который
+    не удалось разобрать, в кэш не попадает.
+    """
+    with open_apkindex(url, cache_dir, max_age) as stream:
+        if isinstance(stream, CachingReader):
+            packages = build_packages(iter_apkindex_archive(stream))
+            stream.commit()
+            return packages
+        if parse_cached:
+            return build_packages(iter_apkindex_archive(stream))
+    return None
+
+
+def load_all(urls: List[str], cache_dir: str = CACHE_DIR, max_age: float = CACHE_MAX_AGE,
+             workers: int = DOWNLOAD_WORKERS) -> Dict[str, Optional[Dict[str, Package]]]:
+    # Параллельный load_apkindex для всех url; результат в порядке urls
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls)))) as executor:
+        futures = {url: executor.submit(load_apkindex, url, cache_dir, max_age) for url in urls}
+        return {url: future.result() for url, future in futures.items()}
+
+
+def snapshot_path(cache_dir: str, urls: List[str]) -> str:
+    # Свой снимок для каждого набора репозиториев и архитектур
+    key = hashlib.sha256('\n'.join(urls).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, f"packages-{key}.db")
+
+
+def iter_stanzas(lines: Iterable[str]) -> Iterator[Dict[str, str]]:
+    """
+    Разбирает текст APKINDEX на записи пакетов: словари 'поле' -> значение.
+    Записи разделены пустыми строками; новая строка P: тоже начинает новую
+    запись. Повторённое поле дописывается к значению через пробел.
+    """
+    stanza = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            if stanza:
+                yield stanza
+                stanza = {}
+            continue
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+        value = value.strip()
+        if key == 'P' and 'P' in stanza:
+            yield stanza
+            stanza = {}
+        if key in stanza:
+            stanza[key] = f"{stanza[key]} {value}".strip()
+        else:
+            stanza[key] = value
+    if stanza:
+        yield stanza
+
+
+def build_packages_db(stanzas: Iterable[Dict[str, str]]) -> Dict[str, List[str]]:
+    # Словарь пакет -> зависимости из записей APKINDEX; записи без P: пропускаются
+    packages_db = {}
+    for stanza in stanzas:
+        name = stanza.get('P')
+        if name:
+            packages_db[name] = stanza.get('D', '').split()
+    return packages_db
+
+
+def iter_apkindex_archive(fileobj: BinaryIO) -> Iterator[Dict[str, str]]:
+    """
+    Записи пакетов из потока APKINDEX.tar.gz. Архив читается последовательно,
+    без перемотки и без распаковки на диск, поэтому подходит и тело HTTP-ответа.
+    В репозитории Alpine это несколько склеенных gzip-потоков (подпись и индекс),
+    их разбирает GzipFile.
+    """
+    try:
+        with gzip.GzipFile(fileobj=fileobj, mode='rb') as gz, \
+                tarfile.open(fileobj=gz, mode='r|') as tar:
+            for member in tar:
+                if member.name == 'APKINDEX' and member.isfile():
+                    # TextIOWrapper проверяет seekable(), что не поддерживает потоковый tar
+                    lines = (line.decode('utf-8') for line in tar.extractfile(member))
+                    yield from iter_stanzas(lines)
+                    return
+    except (tarfile.TarError, OSError, EOFError, zlib.error) as e:
+        raise RuntimeError(f"Ошибка при распаковке APKINDEX: {e}")
+    raise FileNotFoundError("Файл APKINDEX не найден в архиве")
+
+
 def parse_apkindex(apkindex_path: str) -> Dict[str, List[str]]:
 
     #Парсит файл APKINDEX и возвращает словарь пакетов с их зависимостями.
@@ -57,33 +303,12 @@ def parse_apkindex(apkindex_path: str) -> Dict[str, List[str]]:
     if not os.path.exists(apkindex_path):
         raise FileNotFoundError(f"Файл APKINDEX не найден: {apkindex_path}")
 
-    packages_db = {}
-    current_package = None
-    dependencies = []
-
     try:
         with open(apkindex_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue  # Пропускаем пустые строки
-                if line.startswith('P:'):
-                    if current_package:
-                        packages_db[current_package] = dependencies
-                    current_package = line[2:].strip()
-                    dependencies = []
-                elif line.startswith('D:'):
-                    dep_line = line[2:].strip()
-                    if dep_line:
-                        deps = dep_line.split()
-                        dependencies.extend(deps)
-            if current_package:
-                packages_db[current_package] = dependencies
+            return build_packages_db(iter_stanzas(f))
     except Exception as e:
         raise IOError(f"Ошибка чтения файла APKINDEX: {e}")
 
-    return packages_db
-
 
 def build_dependency_graph(package_name: str, packages_db: Dict[str, List[str]]) -> Dict[str, List[str]]:
 
@@ -92,18 +317,16 @@ def build_dependency_graph(package_name: str, packages_db: Dict[str, List[str]])
     if package_name not in packages_db:
         raise ValueError(f"Пакет '{package_name}' не найден в APKINDEX.")
 
+    # Обход в глубину со своим стеком: длинные цепочки не упираются в предел рекурсии
     dependency_graph = {}
-    visited: Set[str] = set()
-
-    def visit(pkg: str):
-        if pkg not in visited:
-            visited.add(pkg)
-            deps = packages_db.get(pkg, [])
-            dependency_graph[pkg] = deps
-            for dep in deps:
-                visit(dep)
-
-    visit(package_name)
+    stack = [package_name]
+    while stack:
+        pkg = stack.pop()
+        if pkg in dependency_graph:
+            continue
+        deps = packages_db.get(pkg, [])
+        dependency_graph[pkg] = deps
+        stack.extend(reversed(deps))
     return dependency_graph
 
 
@@ -158,76 +381,173 @@ def display_image(image_path: str) -> None:
         print(f"Невозможно автоматически открыть изображение. Оно сохранено по пути: {image_path}")
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python dependency_visualizer.py <package_name>")
+def load_package_graph(urls: List[str], cache_dir: str = CACHE_DIR,
+                       max_age: float = CACHE_MAX_AGE) -> PackageGraph:
+    """
+    Граф пакетов всех репозиториев urls: из снимка, если индексы не изменились,
+    иначе разбором индексов (скачиваемые разбираются во время загрузки).
+    """
+    print("Начало загрузки APKINDEX файлов...")
+    loaded = load_all(urls, cache_dir, max_age)
+
+    checksum = index_checksum(cache_paths(url, cache_dir)[0] for url in urls)
+    snapshot = snapshot_path(cache_dir, urls)
+    if all(parsed is None for parsed in loaded.values()):
+        graph = load_snapshot(snapshot, checksum)
+        if graph is not None:
+            print(f"База пакетов загружена из снимка: {snapshot}")
+            return graph
+
+    print("Парсинг APKINDEX файлов...")
+    packages = {}
+    for url in urls:
+        try:
+            parsed = loaded[url]
+            if parsed is None:
+                with open(cache_paths(url, cache_dir)[0], 'rb') as f:
+                    parsed = build_packages(iter_apkindex_archive(f))
+        except Exception as e:
+            raise RuntimeError(f"Ошибка при парсинге {url}: {e}")
+        packages.update(parsed)
+        print(f"Парсинг файла: {url} завершён. Найдено пакетов: {len(parsed)}")
+    # Зависимости разрешаются после объединения репозиториев: пакет из community
+    # может зависеть от so: или cmd:, предоставляемых пакетом из main
+    graph = PackageGraph.from_db(resolve_dependencies(packages))
+    try:
+        write_snapshot(graph, snapshot, checksum)
+    except OSError as e:
+        print(f"Не удалось сохранить снимок базы пакетов: {e}")
+    return graph
+
+
+def print_largest_closures(graph: PackageGraph, count: int) -> None:
+    # Замыкания всех пакетов считаются одним проходом с общей мемоизацией
+    sizes = graph.closure_sizes(range(graph.package_count))
+    largest = sorted(sizes.items(), key=lambda item: (-item[1], graph.names[item[0]]))[:count]
+    for node_id, size in largest:
+        print(f"{size:6d}  {graph.names[node_id]}")
+
+
+def print_dependents(graph: PackageGraph, package_name: str) -> None:
+    # Что сломается при удалении пакета: все, кто зависит от него прямо или через другие пакеты
+    dependents = graph.dependents(graph.ids[package_name])
+    if not dependents:
+        print(f"От пакета '{package_name}' не зависит ни один пакет.")
+        return
+    direct = sum(1 for depth in dependents.values() if depth == 1)
+    print(f"От пакета '{package_name}' зависят {len(dependents)} пакетов "
+          f"(напрямую: {direct}, наибольшая глубина: {max(dependents.values())}):")
+    for node_id, depth in sorted(dependents.items(), key=lambda item: (item[1], graph.names[item[0]])):
+        print(f"{depth:4d}  {graph.names[node_id]}")
+
+
+def print_cycles(graph: PackageGraph) -> None:
+    cycles = graph.cycles()
+    if not cycles:
+        print("Циклических зависимостей не найдено.")
+        return
+    print(f"Найдено циклических зависимостей: {len(cycles)}")
+    for group in sorted(cycles, key=lambda group: (-len(group), group)):
+        print(f"{len(group):4d}  {', '.join(group)}")
+
+
+def print_install_order(graph: PackageGraph, package_name: str) -> None:
+    # Пакеты из одного цикла устанавливаются вместе и выводятся одной строкой
+    order = graph.install_order(package_name)
+    print(f"Порядок установки '{package_name}' ({sum(len(group) for group in order)} пакетов):")
+    for step, group in enumerate(order, 1):
+        suffix = "  (цикл)" if len(group) > 1 else ""
+        print(f"{step:4d}  {', '.join(group)}{suffix}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Визуализация графа зависимостей пакета Alpine Linux")
+    parser.add_argument('package_name', nargs='?')
+    parser.add_argument('--graphviz', default=r"/opt/homebrew/bin/dot", help="путь к программе dot")
+    parser.add_argument('--arch', action='append', help="архитектура (можно указать несколько раз)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="каталог кэша APKINDEX")
+    parser.add_argument('--max-age', type=float, default=CACHE_MAX_AGE,
+                        help="сколько секунд использовать кэш без проверки на сервере")
+    parser.add_argument('--largest', type=int, metavar='N',
+                        help="вывести N пакетов с наибольшим числом транзитивных зависимостей")
+    parser.add_argument('--dependents', action='store_true',
+                        help="вывести пакеты, которые транзитивно зависят от указанного")
+    parser.add_argument('--install-order', action='store_true',
+                        help="вывести порядок установки пакета и его зависимостей")
+    parser.add_argument('--cycles', action='store_true',
+                        help="вывести все циклические зависимости в репозиториях")
+    parser.add_argument('--condense', action='store_true',
+                        help="свернуть циклы в графе в отдельные узлы")
+    args = parser.parse_args(argv)
+    if args.package_name is None and args.largest is None and not args.cycles:
+        parser.error("не указано имя пакета")
+
+    package_name = args.package_name
+    graphviz_path = args.graphviz
+
+    needs_graphviz = args.largest is None and not (args.dependents or args.install_order or args.cycles)
+    if needs_graphviz and not os.path.isfile(graphviz_path):
+        print(f"Graphviz не найден по пути: {graphviz_path}")
         sys.exit(1)
 
-    package_name = sys.argv[1]
-    graphviz_path = r"/opt/homebrew/bin/dot"
+    architectures = list(dict.fromkeys(args.arch or ARCHITECTURES))
+    sources = [(repo, arch) for arch in architectures for repo in REPOSITORIES]
+    urls = [apkindex_url(repo, arch) for repo, arch in sources]
 
-    if not os.path.isfile(graphviz_path):
-        print(f"Graphviz не найден по пути: {graphviz_path}")
+    try:
+        graph = load_package_graph(urls, args.cache_dir, args.max_age)
+    except Exception as e:
+        print(f"Ошибка при загрузке APKINDEX: {e}")
         sys.exit(1)
 
-    # URLs репозиториев Alpine Linux
-    repositories = [
-        "https://dl-cdn.alpinelinux.org/alpine/latest-stable/main",
-        "https://dl-cdn.alpinelinux.org/alpine/latest-stable/community"
-    ]
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        print("Начало загрузки APKINDEX файлов...")
-        apkindex_files = []
-        for repo in repositories:
-            try:
-                apkindex_path = download_apkindex(repo, temp_dir)
-                apkindex_files.append(apkindex_path)
-                print(f"Файл APKINDEX извлечён и доступен: {apkindex_path}")
-            except Exception as e:
-                print(f"Ошибка при загрузке APKINDEX из {repo}: {e}")
-                sys.exit(1)
-
-        print("Парсинг APKINDEX файлов...")
-        packages_db = {}
-        for apkindex in apkindex_files:
-            try:
-                parsed = parse_apkindex(apkindex)
-                packages_db.update(parsed)
-                print(f"Парсинг файла: {apkindex} завершён. Найдено пакетов: {len(parsed)}")
-            except Exception as e:
-                print(f"Ошибка при парсинге {apkindex}: {e}")
-                sys.exit(1)
-
-        print(f"Всего найдено пакетов: {len(packages_db)}")
-
-        # Проверка наличия искомого пакета
-        if package_name not in packages_db:
-            print(f"Пакет '{package_name}' не найден в APKINDEX.")
-            print("Возможные причины:")
-            print("- Неверное имя пакета (проверьте регистр и точность имени).")
-            print("- Пакет отсутствует в репозиториях 'main' и 'community'.")
-            sys.exit(1)
+    print(f"Всего найдено пакетов: {graph.package_count}")
+    if args.largest is not None:
+        print_largest_closures(graph, args.largest)
+        return
+    if args.cycles:
+        print_cycles(graph)
+        return
+
+    # Проверка наличия искомого пакета
+    if package_name not in graph:
+        print(f"Пакет '{package_name}' не найден в APKINDEX.")
+        print("Возможные причины:")
+        print("- Неверное имя пакета (проверьте регистр и точность имени).")
+        print("- Пакет отсутствует в репозиториях 'main' и 'community'.")
+        sys.exit(1)
 
-        try:
-            dependency_graph = build_dependency_graph(package_name, packages_db)
-            print(f"Граф зависимостей для '{package_name}' успешно построен.")
-        except Exception as e:
-            print(f"Ошибка: {e}")
-            sys.exit(1)
+    if args.dependents:
+        print_dependents(graph, package_name)
+        return
+    if args.install_order:
+        print_install_order(graph, package_name)
+        return
 
-        dot_code = generate_graphviz(dependency_graph)
-        print("Сгенерирован код DOT:")
-        print(dot_code)
+    try:
+        if args.condense:
+            dependency_graph = graph.condensed_graph(package_name)
+        else:
+            dependency_graph = graph.dependency_graph(package_name)
+        print(f"Граф зависимостей для '{package_name}' успешно построен.")
+        for group in graph.install_order(package_name):
+            if len(group) > 1:
+                print(f"Циклическая зависимость: {', '.join(group)}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
 
-        output_image_path = os.path.join(os.getcwd(), f"{package_name}_dependencies.png")
-        try:
-            generate_image(dot_code, graphviz_path, output_image_path)
-            print(f"Граф зависимостей успешно сохранен в {output_image_path}")
-            display_image(output_image_path)
-        except Exception as e:
-            print(f"Ошибка при генерации изображения: {e}")
-            sys.exit(1)
+    dot_code = generate_graphviz(dependency_graph)
+    print("Сгенерирован код DOT:")
+    print(dot_code)
+
+    output_image_path = os.path.join(os.getcwd(), f"{package_name}_dependencies.png")
+    try:
+        generate_image(dot_code, graphviz_path, output_image_path)
+        print(f"Граф зависимостей успешно сохранен в {output_image_path}")
+        display_image(output_image_path)
+    except Exception as e:
+        print(f"Ошибка при генерации изображения: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
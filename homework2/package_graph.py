@@ -0,0 +1,353 @@
+import hashlib
+import os
+import struct
+import sys
+from array import array
+from typing import Container, Dict, Iterable, Iterator, List, Optional, Tuple
+
+SNAPSHOT_MAGIC = b'APKDB002'
+# magic, контрольная сумма индексов (sha256), число пакетов, число имён,
+# число рёбер, длина блока имён в байтах
+SNAPSHOT_HEADER = struct.Struct('<8s32sIIII')
+# Номера узлов и смещения хранятся 32-битными беззнаковыми числами
+ID_TYPECODE = 'I'
+
+
+class PackageGraph:
+    """
+    Граф зависимостей в компактном виде. Имена пакетов интернированы и заменены
+    номерами, рёбра хранятся в формате CSR: зависимости узла i —
+    targets[offsets[i]:offsets[i + 1]]. Первые package_count номеров — пакеты
+    из APKINDEX, остальные — имена, встречающиеся только в зависимостях.
+    """
+
+    def __init__(self, names: List[str], package_count: int, offsets: array, targets: array):
+        self.names = names
+        self.ids = {name: node_id for node_id, name in enumerate(names)}
+        self.package_count = package_count
+        self.offsets = offsets
+        self.targets = targets
+        # Замыкания уже обработанных узлов (битовые маски номеров); граф неизменяем,
+        # поэтому они переиспользуются всеми последующими запросами
+        self._closures: Dict[int, int] = {}
+        # Обратный индекс (offsets, targets) в том же формате CSR, строится по запросу
+        self._reverse: Optional[Tuple[array, array]] = None
+        # Компоненты сильной связности и сжатый по ним граф, строятся по запросу
+        self._components: Optional[List[List[int]]] = None
+        self._condensation: Optional[Tuple[array, array, array]] = None
+
+    @classmethod
+    def from_db(cls, packages_db: Dict[str, List[str]]) -> 'PackageGraph':
+        names = list(packages_db)
+        ids = {name: node_id for node_id, name in enumerate(names)}
+        offsets = array(ID_TYPECODE, [0])
+        targets = array(ID_TYPECODE)
+        for deps in packages_db.values():
+            for dep in deps:
+                dep_id = ids.get(dep)
+                if dep_id is None:
+                    dep_id = ids[dep] = len(names)
+                    names.append(dep)
+                targets.append(dep_id)
+            offsets.append(len(targets))
+        # У имён, которых нет среди пакетов, зависимостей нет
+        offsets.extend([len(targets)] * (len(names) - len(packages_db)))
+        return cls(names, len(packages_db), offsets, targets)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        node_id = self.ids.get(name)
+        return node_id is not None and node_id < self.package_count
+
+    def deps(self, node_id: int) -> array:
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def closure(self, node_id: int) -> List[int]:
+        # Узлы, достижимые из node_id (включая его), в порядке обхода в глубину
+        seen = {node_id}
+        order = []
+        stack = [node_id]
+        offsets, targets = self.offsets, self.targets
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            for pos in range(offsets[current + 1] - 1, offsets[current] - 1, -1):
+                dep = targets[pos]
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return order
+
+    def dependency_graph(self, name: str) -> Dict[str, List[str]]:
+        # То же, что build_dependency_graph, но по номерам узлов
+        names = self.names
+        return {names[node_id]: [names[dep] for dep in self.deps(node_id)]
+                for node_id in self.closure(self.ids[name])}
+
+    def _iter_components(self, roots: Iterable[int], done: Container[int]) -> Iterator[List[int]]:
+        """
+        Итеративный алгоритм Тарьяна: компоненты сильной связности, достижимые
+        из roots. Компонента выдаётся только после всех компонент, от которых
+        она зависит. Узлы из done считаются уже обработанными и не обходятся.
+        """
+        offsets, targets = self.offsets, self.targets
+        index: Dict[int, int] = {}
+        low: Dict[int, int] = {}
+        stack: List[int] = []
+        on_stack = set()
+        for root in roots:
+            if root in done or root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, offsets[root])]
+            while work:
+                node, pos = work[-1]
+                if pos < offsets[node + 1]:
+                    work[-1] = (node, pos + 1)
+                    dep = targets[pos]
+                    if dep in done:
+                        continue
+                    if dep not in index:
+                        index[dep] = low[dep] = len(index)
+                        stack.append(dep)
+                        on_stack.add(dep)
+                        work.append((dep, offsets[dep]))
+                    elif dep in on_stack:
+                        low[node] = min(low[node], index[dep])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        members.append(member)
+                        if member == node:
+                            break
+                    yield members
+
+    def closures(self, roots: Iterable[int]) -> Dict[int, int]:
+        """
+        Транзитивные замыкания сразу для многих узлов: root -> битовая маска
+        номеров достижимых узлов (включая root). Компоненты сильной связности
+        приходят в порядке, когда всё достижимое из компоненты уже замкнуто,
+        поэтому замыкание компоненты — объединение её узлов и готовых масок
+        соседей. Каждый узел и ребро обрабатываются один раз на все запросы.
+        """
+        roots = list(roots)
+        memo = self._closures
+        for members in self._iter_components(roots, memo):
+            mask = 0
+            for member in members:
+                mask |= 1 << member
+            for member in members:
+                for dep in self.deps(member):
+                    known = memo.get(dep)
+                    if known is not None:
+                        mask |= known
+            for member in members:
+                memo[member] = mask
+        return {root: memo[root] for root in roots}
+
+    def closure_sizes(self, roots: Iterable[int]) -> Dict[int, int]:
+        # Число транзитивных зависимостей (без самого пакета)
+        return {root: mask.bit_count() - 1 for root, mask in self.closures(roots).items()}
+
+    def components(self) -> List[List[int]]:
+        # Компоненты сильной связности всего графа; зависимости идут раньше зависящих от них
+        if self._components is None:
+            self._components = list(self._iter_components(range(len(self.names)), ()))
+        return self._components
+
+    def condensation(self) -> Tuple[array, array, array]:
+        """
+        Сжатый граф: каждая компонента сильной связности — один узел.
+        Возвращает (component_of, offsets, targets): номер компоненты каждого
+        узла и рёбра между компонентами в формате CSR. Номера компонент —
+        позиции в components(), рёбра всегда ведут к меньшим номерам, так что
+        порядок номеров топологический (зависимости первыми).
+        """
+        if self._condensation is None:
+            components = self.components()
+            component_of = array(ID_TYPECODE, [0]) * len(self.names)
+            for component_id, members in enumerate(components):
+                for member in members:
+                    component_of[member] = component_id
+            offsets = array(ID_TYPECODE, [0])
+            targets = array(ID_TYPECODE)
+            for component_id, members in enumerate(components):
+                seen = {component_id}
+                for member in members:
+                    for dep in self.deps(member):
+                        dep_component = component_of[dep]
+                        if dep_component not in seen:
+                            seen.add(dep_component)
+                            targets.append(dep_component)
+                offsets.append(len(targets))
+            self._condensation = component_of, offsets, targets
+        return self._condensation
+
+    def cycles(self) -> List[List[str]]:
+        # Циклические зависимости: компоненты из нескольких пакетов или пакет, зависящий от себя
+        cycles = []
+        for members in self.components():
+            if len(members) > 1 or members[0] in self.deps(members[0]):
+                cycles.append(sorted(self.names[member] for member in members))
+        return cycles
+
+    def _reachable_components(self, name: str) -> List[int]:
+        # Компоненты, достижимые из пакета, в топологическом порядке (зависимости первыми)
+        component_of, offsets, targets = self.condensation()
+        start = component_of[self.ids[name]]
+        seen = {start}
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            for pos in range(offsets[current], offsets[current + 1]):
+                dep = targets[pos]
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        return sorted(seen)
+
+    def install_order(self, name: str) -> List[List[str]]:
+        """
+        Порядок установки пакета со всеми зависимостями: каждый шаг — пакет
+        или группа пакетов, образующих цикл и устанавливаемых вместе.
+        """
+        components = self.components()
+        return [sorted(self.names[member] for member in components[component_id])
+                for component_id in self._reachable_components(name)]
+
+    def condensed_graph(self, name: str) -> Dict[str, List[str]]:
+        """
+        Граф зависимостей пакета, в котором каждый цикл свёрнут в один узел
+        с подписью '{a, b, c}'. Формат тот же, что у dependency_graph().
+        """
+        components = self.components()
+        _, offsets, targets = self.condensation()
+        reachable = self._reachable_components(name)
+        labels = {}
+        for component_id in reachable:
+            group = sorted(self.names[member] for member in components[component_id])
+            labels[component_id] = group[0] if len(group) == 1 else '{' + ', '.join(group) + '}'
+        # Сначала сам пакет, как в dependency_graph()
+        return {labels[component_id]: [labels[targets[pos]]
+                                       for pos in range(offsets[component_id], offsets[component_id + 1])]
+                for component_id in reversed(reachable)}
+
+    def reverse_index(self) -> Tuple[array, array]:
+        """
+        Обратные рёбра: пакеты, зависящие от узла i, —
+        targets[offsets[i]:offsets[i + 1]]. Строится подсчётом за O(V + E)
+        один раз и переиспользуется всеми запросами к графу.
+        """
+        if self._reverse is None:
+            node_count = len(self.names)
+            counts = [0] * (node_count + 1)
+            for dep in self.targets:
+                counts[dep + 1] += 1
+            for node_id in range(node_count):
+                counts[node_id + 1] += counts[node_id]
+            offsets = array(ID_TYPECODE, counts)
+            targets = array(ID_TYPECODE, bytes(len(self.targets) * offsets.itemsize))
+            fill = counts[:-1]
+            for node_id in range(node_count):
+                for pos in range(self.offsets[node_id], self.offsets[node_id + 1]):
+                    dep = self.targets[pos]
+                    targets[fill[dep]] = node_id
+                    fill[dep] += 1
+            self._reverse = offsets, targets
+        return self._reverse
+
+    def dependents(self, node_id: int) -> Dict[int, int]:
+        # Все пакеты, транзитивно зависящие от node_id: номер -> глубина (1 — прямые)
+        offsets, targets = self.reverse_index()
+        depths = {node_id: 0}
+        frontier = [node_id]
+        depth = 0
+        while frontier:
+            depth += 1
+            next_frontier = []
+            for current in frontier:
+                for pos in range(offsets[current], offsets[current + 1]):
+                    dependent = targets[pos]
+                    if dependent not in depths:
+                        depths[dependent] = depth
+                        next_frontier.append(dependent)
+            frontier = next_frontier
+        del depths[node_id]
+        return depths
+
+    def to_db(self) -> Dict[str, List[str]]:
+        names = self.names
+        return {names[node_id]: [names[dep] for dep in self.deps(node_id)]
+                for node_id in range(self.package_count)}
+
+
+def index_checksum(paths: Iterable[str]) -> bytes:
+    # sha256 содержимого файлов индексов в заданном порядке
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def write_snapshot(graph: PackageGraph, path: str, checksum: bytes) -> None:
+    """
+    Сохраняет граф в двоичный снимок: заголовок, имена через '\\0' и массивы
+    offsets и targets как есть. Файл заменяется атомарно.
+    """
+    names_blob = '\0'.join(graph.names).encode('utf-8')
+    offsets, targets = graph.offsets, graph.targets
+    if sys.byteorder != 'little':
+        offsets, targets = array(ID_TYPECODE, offsets), array(ID_TYPECODE, targets)
+        offsets.byteswap()
+        targets.byteswap()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, checksum, graph.package_count,
+                                     len(graph.names), len(targets), len(names_blob)))
+        f.write(names_blob)
+        f.write(offsets.tobytes())
+        f.write(targets.tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str, checksum: bytes) -> Optional[PackageGraph]:
+    # Возвращает None, если снимка нет, он повреждён или построен по другим индексам
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, stored_checksum, package_count, name_count, edge_count, names_size = \
+            SNAPSHOT_HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or stored_checksum != checksum:
+            return None
+        pos = SNAPSHOT_HEADER.size
+        names = data[pos:pos + names_size].decode('utf-8').split('\0') if name_count else []
+        pos += names_size
+        offsets = array(ID_TYPECODE)
+        offsets.frombytes(data[pos:pos + (name_count + 1) * offsets.itemsize])
+        pos += (name_count + 1) * offsets.itemsize
+        targets = array(ID_TYPECODE)
+        targets.frombytes(data[pos:pos + edge_count * targets.itemsize])
+        pos += edge_count * targets.itemsize
+        if (len(names) != name_count or len(offsets) != name_count + 1
+                or len(targets) != edge_count or pos != len(data)):
+            return None
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            targets.byteswap()
+        return PackageGraph(names, package_count, offsets, targets)
+    except (OSError, ValueError, struct.error):
+        return None
@@ -0,0 +1,66 @@
+import unittest
+
+from apkindex import Dependency, Package, ProvidesIndex, build_packages, parse_dependency, \
+    resolve_dependencies, satisfies, version_key
+
+
+def package(name, version='1.0-r0', depends=(), provides=(), priority=0):
+    return Package(name, version, tuple(depends), tuple(provides), 0, 0, priority)
+
+
+class TestApkIndex(unittest.TestCase):
+    def test_version_order(self):
+        versions = ['1.2_alpha1', '1.2_rc1', '1.2', '1.2-r1', '1.2_p1', '1.2a', '1.2.1', '1.10']
+        self.assertEqual(sorted(reversed(versions), key=version_key), versions)
+        self.assertTrue(satisfies('1.36.1-r2', '>=', '1.36'))
+        self.assertFalse(satisfies('1.35.9', '>=', '1.36'))
+        self.assertTrue(satisfies('3.1.4-r0', '~', '3.1'))
+        self.assertFalse(satisfies('3.10', '~', '3.1'))
+
+    def test_parse_dependency(self):
+        self.assertEqual(parse_dependency('so:libc.musl-x86_64.so.1'),
+                         Dependency('so:libc.musl-x86_64.so.1', None, None, False))
+        self.assertEqual(parse_dependency('busybox>=1.36'), Dependency('busybox', '>=', '1.36', False))
+        self.assertEqual(parse_dependency('!openssl-dev'), Dependency('openssl-dev', None, None, True))
+
+    def test_build_packages_from_stanzas(self):
+        packages = build_packages([
+            {'P': 'musl', 'V': '1.2.4-r2', 'p': 'so:libc.musl-x86_64.so.1=1', 'S': '383000', 'I': '626000'},
+            {'V': '1.0'},
+        ])
+        self.assertEqual(packages, {'musl': Package('musl', '1.2.4-r2', (), ('so:libc.musl-x86_64.so.1=1',),
+                                                    383000, 626000, 0)})
+
+    def test_resolve_virtual_dependencies(self):
+        packages = {p.name: p for p in [
+            package('musl', provides=['so:libc.musl-x86_64.so.1=1']),
+            package('busybox', '1.36.1-r5', depends=['so:libc.musl-x86_64.so.1'], provides=['cmd:sh=1.36.1-r5']),
+            package('zlib-dev', depends=['pc:zlib']),
+            package('zlib', provides=['pc:zlib=1.3']),
+            package('app', depends=['busybox>=1.36', '/bin/sh', '!busybox-static', 'so:libmissing.so.1',
+                                    'pc:zlib>=2']),
+        ]}
+        self.assertEqual(resolve_dependencies(packages), {
+            'musl': [],
+            'busybox': ['musl'],
+            'zlib-dev': ['zlib'],
+            'zlib': [],
+            'app': ['busybox', 'so:libmissing.so.1', 'pc:zlib'],
+        })
+
+    def test_provider_choice(self):
+        index = ProvidesIndex([
+            package('sh-a', provides=['cmd:sh'], priority=10),
+            package('sh-b', provides=['cmd:sh'], priority=100),
+            package('lib-old', provides=['so:libx.so.1=1.0']),
+            package('lib-new', provides=['so:libx.so.1=2.0']),
+        ])
+        self.assertEqual(index.resolve(parse_dependency('cmd:sh')), 'sh-b')
+        self.assertEqual(index.resolve(parse_dependency('so:libx.so.1')), 'lib-new')
+        self.assertEqual(index.resolve(parse_dependency('so:libx.so.1<2')), 'lib-old')
+        # Поставщик без версии не удовлетворяет условию на версию
+        self.assertIsNone(index.resolve(parse_dependency('cmd:sh>=1')))
+
+
+if __name__ == '__main__':
+    unittest.main()
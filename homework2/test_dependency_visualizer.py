@@ -1,10 +1,72 @@
 import unittest
 from unittest import mock
 from unittest.mock import patch, mock_open, MagicMock
+import gzip
+import io
 import tempfile
 import os
+import threading
 import dependency_visualizer
 import tarfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_apkindex_tar(content: str, signed: bool = False) -> bytes:
+    """
+    tar.gz с файлом APKINDEX. С signed архив устроен как в репозитории Alpine:
+    отдельный gzip-поток с подписью без завершающих блоков tar, за ним индекс.
+    """
+    data = content.encode('utf-8')
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        info = tarfile.TarInfo('APKINDEX')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    if not signed:
+        return buffer.getvalue()
+    signature = tarfile.TarInfo('.SIGN.RSA.key.rsa.pub')
+    signature.size = 3
+    header = signature.tobuf() + b'sig'.ljust(tarfile.BLOCKSIZE, b'\0')
+    return gzip.compress(header) + buffer.getvalue()
+
+
+class ApkRepositoryServer:
+    # Локальный HTTP-сервер вместо зеркала Alpine: отдаёт APKINDEX.tar.gz с ETag
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append((self.path, self.headers.get('If-None-Match')))
+                body = server.files.get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = f'"{hash(body)}"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
 
 
 class TestDependencyVisualizer(unittest.TestCase):
@@ -126,6 +188,15 @@ class TestDependencyVisualizer(unittest.TestCase):
         }
         self.assertEqual(dependency_graph, expected)
 
+    def test_build_dependency_graph_deep_chain(self):
+        # Цепочка длиннее предела рекурсии
+        depth = 5000
+        packages_db = {f'p{i}': [f'p{i + 1}'] for i in range(depth)}
+        packages_db[f'p{depth}'] = []
+        dependency_graph = dependency_visualizer.build_dependency_graph('p0', packages_db)
+        self.assertEqual(len(dependency_graph), depth + 1)
+        self.assertEqual(dependency_graph[f'p{depth - 1}'], [f'p{depth}'])
+
     def test_generate_graphviz(self):
         dependency_graph = {
             'packageA': ['packageB', 'packageC'],
@@ -292,5 +363,129 @@ class TestDependencyVisualizer(unittest.TestCase):
         self.assertIn("Пакет 'packageC' не найден в APKINDEX.", str(context.exception))
 
 
+    @patch('dependency_visualizer.print')
+    def test_load_all_uses_conditional_requests_and_cache(self, mock_print):
+        server = ApkRepositoryServer({
+            '/main/x86_64/APKINDEX.tar.gz': make_apkindex_tar("P:packageA\nD:packageB\n"),
+            '/community/x86_64/APKINDEX.tar.gz': make_apkindex_tar("P:packageB\n"),
+        })
+        self.addCleanup(server.close)
+        urls = [dependency_visualizer.apkindex_url(f"{server.url}/{repo}") for repo in ('main', 'community')]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            loaded = dependency_visualizer.load_all(urls, cache_dir)
+            self.assertEqual(list(loaded), urls)
+            self.assertEqual(list(loaded[urls[0]]), ['packageA'])
+            self.assertEqual(len(server.requests), 2)
+
+            # Свежий кэш: сеть не используется, копии не разбираются
+            self.assertEqual(dependency_visualizer.load_all(urls, cache_dir), {url: None for url in urls})
+            self.assertEqual(len(server.requests), 2)
+
+            # Устаревший кэш: условный запрос и ответ 304 без тела
+            dependency_visualizer.load_all(urls, cache_dir, max_age=0)
+            self.assertEqual(len(server.requests), 4)
+            self.assertTrue(all(etag for _, etag in server.requests[2:]))
+            data_path = dependency_visualizer.cache_paths(urls[0], cache_dir)[0]
+            extracted = dependency_visualizer.extract_apkindex(data_path, cache_dir, 'APKINDEX-main')
+            self.assertEqual(dependency_visualizer.parse_apkindex(extracted), {'packageA': ['packageB']})
+
+            with self.assertRaises(ConnectionError):
+                dependency_visualizer.load_all([f"{server.url}/missing/APKINDEX.tar.gz"], cache_dir)
+
+    def test_iter_stanzas(self):
+        lines = ["P:packageA", "V:1.0-r0", "D:packageB", "D:so:libc.so", "", "", "P:packageB", "P:packageC", ""]
+        self.assertEqual(list(dependency_visualizer.iter_stanzas(lines)), [
+            {'P': 'packageA', 'V': '1.0-r0', 'D': 'packageB so:libc.so'},
+            {'P': 'packageB'},
+            {'P': 'packageC'},
+        ])
+
+    @patch('dependency_visualizer.print')
+    def test_load_apkindex_streams_response_into_cache(self, mock_print):
+        archive = make_apkindex_tar("P:packageA\nV:1.0-r0\nD:packageB\n\nP:packageB\nV:2.0-r1\n", signed=True)
+        server = ApkRepositoryServer({'/main/x86_64/APKINDEX.tar.gz': archive})
+        self.addCleanup(server.close)
+        url = dependency_visualizer.apkindex_url(f"{server.url}/main")
+        expected = {
+            'packageA': dependency_visualizer.Package('packageA', '1.0-r0', ('packageB',), (), 0, 0, 0),
+            'packageB': dependency_visualizer.Package('packageB', '2.0-r1', (), (), 0, 0, 0),
+        }
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # Скачанный индекс разбирается из потока ответа, на диске только кэш
+            self.assertEqual(dependency_visualizer.load_all([url], cache_dir), {url: expected})
+            self.assertEqual(sorted(name.rsplit('.', 1)[-1] for name in os.listdir(cache_dir)), ['gz', 'json'])
+            with open(dependency_visualizer.cache_paths(url, cache_dir)[0], 'rb') as f:
+                self.assertEqual(f.read(), archive)
+
+            # Копия из кэша разбирается только по запросу
+            self.assertIsNone(dependency_visualizer.load_apkindex(url, cache_dir))
+            self.assertEqual(dependency_visualizer.load_apkindex(url, cache_dir, parse_cached=True), expected)
+            self.assertEqual(len(server.requests), 1)
+
+    def test_failed_parse_leaves_no_cache_entry(self):
+        server = ApkRepositoryServer({'/main/x86_64/APKINDEX.tar.gz': b'<html>not an index</html>'})
+        self.addCleanup(server.close)
+        url = dependency_visualizer.apkindex_url(f"{server.url}/main")
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with self.assertRaises(Exception):
+                dependency_visualizer.load_apkindex(url, cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+            # Следующий запуск скачивает индекс заново, а не берёт испорченную копию
+            with self.assertRaises(Exception):
+                dependency_visualizer.load_apkindex(url, cache_dir)
+            self.assertEqual(len(server.requests), 2)
+
+    @patch('dependency_visualizer.print')
+    def test_print_dependents(self, mock_print):
+        graph = dependency_visualizer.PackageGraph.from_db({
+            'packageA': ['packageB'],
+            'packageB': ['packageC'],
+            'packageC': [],
+            'packageD': ['packageC'],
+        })
+        dependency_visualizer.print_dependents(graph, 'packageC')
+        lines = [call.args[0] for call in mock_print.call_args_list]
+        self.assertEqual(lines, [
+            "От пакета 'packageC' зависят 3 пакетов (напрямую: 2, наибольшая глубина: 2):",
+            "   1  packageB",
+            "   1  packageD",
+            "   2  packageA",
+        ])
+
+        mock_print.reset_mock()
+        dependency_visualizer.print_dependents(graph, 'packageA')
+        mock_print.assert_called_once_with("От пакета 'packageA' не зависит ни один пакет.")
+
+    @patch('dependency_visualizer.print')
+    def test_print_cycles_and_install_order(self, mock_print):
+        graph = dependency_visualizer.PackageGraph.from_db({
+            'packageA': ['packageB', 'packageC'],
+            'packageB': ['packageA'],
+            'packageC': [],
+        })
+        dependency_visualizer.print_cycles(graph)
+        dependency_visualizer.print_install_order(graph, 'packageA')
+        lines = [call.args[0] for call in mock_print.call_args_list]
+        self.assertEqual(lines, [
+            "Найдено циклических зависимостей: 1",
+            "   2  packageA, packageB",
+            "Порядок установки 'packageA' (3 пакетов):",
+            "   1  packageC",
+            "   2  packageA, packageB  (цикл)",
+        ])
+
+        mock_print.reset_mock()
+        dependency_visualizer.print_cycles(dependency_visualizer.PackageGraph.from_db({'packageA': []}))
+        mock_print.assert_called_once_with("Циклических зависимостей не найдено.")
+
+    def test_iter_apkindex_archive_errors(self):
+        with self.assertRaises(RuntimeError):
+            list(dependency_visualizer.iter_apkindex_archive(io.BytesIO(b'not a tar.gz file')))
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+            tar.addfile(tarfile.TarInfo('OTHERFILE'), io.BytesIO(b''))
+        with self.assertRaises(FileNotFoundError):
+            list(dependency_visualizer.iter_apkindex_archive(io.BytesIO(buffer.getvalue())))
+
 if __name__ == '__main__':
     unittest.main()
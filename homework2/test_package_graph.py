@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+
+from package_graph import PackageGraph, index_checksum, load_snapshot, write_snapshot
+
+
+class TestPackageGraph(unittest.TestCase):
+    def setUp(self):
+        self.packages_db = {
+            'packageA': ['packageB', 'so:libc.so'],
+            'packageB': ['packageC'],
+            'packageC': [],
+        }
+
+    def test_ids_and_csr_adjacency(self):
+        graph = PackageGraph.from_db(self.packages_db)
+        self.assertEqual(graph.names, ['packageA', 'packageB', 'packageC', 'so:libc.so'])
+        self.assertEqual(graph.package_count, 3)
+        self.assertEqual(list(graph.deps(graph.ids['packageA'])), [1, 3])
+        self.assertEqual(list(graph.deps(graph.ids['so:libc.so'])), [])
+        self.assertIn('packageC', graph)
+        self.assertNotIn('so:libc.so', graph)
+        self.assertEqual(graph.to_db(), self.packages_db)
+
+    def test_dependency_graph_matches_build_dependency_graph(self):
+        packages_db = {
+            'packageA': ['packageB', 'packageC'],
+            'packageB': ['packageC', 'packageA'],
+            'packageC': ['so:libc.so'],
+            'packageD': ['packageA'],
+        }
+        graph = PackageGraph.from_db(packages_db)
+        self.assertEqual(graph.dependency_graph('packageA'), {
+            'packageA': ['packageB', 'packageC'],
+            'packageB': ['packageC', 'packageA'],
+            'packageC': ['so:libc.so'],
+            'so:libc.so': [],
+        })
+        self.assertEqual(list(graph.dependency_graph('packageA')), ['packageA', 'packageB', 'packageC', 'so:libc.so'])
+
+    def test_closure_sizes_with_cycles(self):
+        # A <-> B образуют цикл, C и D зависят от него
+        graph = PackageGraph.from_db({
+            'packageA': ['packageB', 'packageE'],
+            'packageB': ['packageA'],
+            'packageC': ['packageA'],
+            'packageD': ['packageC', 'packageB'],
+            'packageE': [],
+        })
+        ids = graph.ids
+        sizes = graph.closure_sizes(range(graph.package_count))
+        self.assertEqual({graph.names[node_id]: size for node_id, size in sizes.items()}, {
+            'packageA': 2, 'packageB': 2, 'packageC': 3, 'packageD': 4, 'packageE': 0,
+        })
+        closures = graph.closures([ids['packageC']])
+        self.assertEqual(closures[ids['packageC']],
+                         sum(1 << ids[name] for name in ('packageA', 'packageB', 'packageC', 'packageE')))
+
+    def test_closures_are_memoized_across_calls(self):
+        graph = PackageGraph.from_db({'packageA': ['packageB'], 'packageB': ['packageC'], 'packageC': []})
+        self.assertEqual(graph.closure_sizes([graph.ids['packageB']]), {1: 1})
+        self.assertIn(graph.ids['packageC'], graph._closures)
+        self.assertEqual(graph.closure_sizes([0, 1]), {0: 2, 1: 1})
+
+    def test_deep_chain_beyond_recursion_limit(self):
+        depth = 5000
+        graph = PackageGraph.from_db({f'p{i}': [f'p{i + 1}'] for i in range(depth)})
+        self.assertEqual(len(graph.closure(0)), depth + 1)
+        self.assertEqual(graph.closure_sizes([0])[0], depth)
+        self.assertEqual(len(graph.dependency_graph('p0')), depth + 1)
+
+    def test_reverse_index_and_dependents(self):
+        graph = PackageGraph.from_db({
+            'packageA': ['packageB', 'packageC'],
+            'packageB': ['packageC'],
+            'packageC': ['packageD'],
+            'packageD': ['packageB'],
+            'packageE': [],
+        })
+        ids, names = graph.ids, graph.names
+        offsets, targets = graph.reverse_index()
+        self.assertEqual(sorted(targets[offsets[ids['packageC']]:offsets[ids['packageC'] + 1]]),
+                         [ids['packageA'], ids['packageB']])
+        self.assertIs(graph.reverse_index()[1], targets)
+
+        # Цикл B -> C -> D -> B: каждый из них зависит от остальных
+        dependents = graph.dependents(ids['packageD'])
+        self.assertEqual({names[node_id]: depth for node_id, depth in dependents.items()},
+                         {'packageC': 1, 'packageA': 2, 'packageB': 2})
+        self.assertEqual(graph.dependents(ids['packageE']), {})
+
+    def test_components_and_condensation(self):
+        # Цикл A <-> B, петля D -> D, E зависит от цикла
+        graph = PackageGraph.from_db({
+            'packageA': ['packageB', 'packageC'],
+            'packageB': ['packageC', 'packageA'],
+            'packageC': ['packageD'],
+            'packageD': ['packageD'],
+            'packageE': ['packageA'],
+        })
+        ids = graph.ids
+        components = graph.components()
+        self.assertEqual(sorted(len(members) for members in components), [1, 1, 1, 2])
+        component_of, offsets, targets = graph.condensation()
+        self.assertEqual(component_of[ids['packageA']], component_of[ids['packageB']])
+        for component_id in range(len(components)):
+            for pos in range(offsets[component_id], offsets[component_id + 1]):
+                self.assertLess(targets[pos], component_id)
+        # Рёбра A -> C и B -> C сливаются в одно
+        ab = component_of[ids['packageA']]
+        self.assertEqual(list(targets[offsets[ab]:offsets[ab + 1]]), [component_of[ids['packageC']]])
+
+        self.assertEqual(graph.cycles(), [['packageD'], ['packageA', 'packageB']])
+        self.assertEqual(graph.install_order('packageE'),
+                         [['packageD'], ['packageC'], ['packageA', 'packageB'], ['packageE']])
+        self.assertEqual(graph.install_order('packageC'), [['packageD'], ['packageC']])
+        self.assertEqual(graph.condensed_graph('packageE'), {
+            'packageE': ['{packageA, packageB}'],
+            '{packageA, packageB}': ['packageC'],
+            'packageC': ['packageD'],
+            'packageD': [],
+        })
+
+    def test_components_of_long_cycle(self):
+        depth = 5000
+        packages_db = {f'p{i}': [f'p{i + 1}'] for i in range(depth)}
+        packages_db[f'p{depth}'] = ['p0']
+        graph = PackageGraph.from_db(packages_db)
+        self.assertEqual(len(graph.components()), 1)
+        self.assertEqual(len(graph.install_order('p0')), 1)
+        self.assertEqual(graph.closure_sizes([0])[0], depth)
+
+    def test_snapshot_round_trip_and_validation(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index_path = os.path.join(temp_dir, 'APKINDEX.tar.gz')
+            with open(index_path, 'wb') as f:
+                f.write(b'index v1')
+            checksum = index_checksum([index_path])
+            snapshot = os.path.join(temp_dir, 'packages.db')
+            write_snapshot(PackageGraph.from_db(self.packages_db), snapshot, checksum)
+
+            graph = load_snapshot(snapshot, checksum)
+            self.assertEqual(graph.to_db(), self.packages_db)
+            self.assertEqual(graph.ids['so:libc.so'], 3)
+
+            # Индекс изменился — снимок не подходит
+            with open(index_path, 'wb') as f:
+                f.write(b'index v2')
+            self.assertIsNone(load_snapshot(snapshot, index_checksum([index_path])))
+
+            # Обрезанный файл не загружается
+            with open(snapshot, 'r+b') as f:
+                f.truncate(os.path.getsize(snapshot) - 1)
+            self.assertIsNone(load_snapshot(snapshot, checksum))
+            self.assertIsNone(load_snapshot(os.path.join(temp_dir, 'missing.db'), checksum))
+
+    def test_empty_database(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            snapshot = os.path.join(temp_dir, 'packages.db')
+            write_snapshot(PackageGraph.from_db({}), snapshot, b'\0' * 32)
+            self.assertEqual(load_snapshot(snapshot, b'\0' * 32).to_db(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()